@@ -0,0 +1,461 @@
+"""
+Local HTTP/JSON API over the expense ledgers.
+
+Serves several clients at once from one process, using the same storage
+backends and indexes as the Tk app. Hot ledgers stay in memory under an
+LRU with a size budget; writes to one user's ledger are serialized.
+
+    python api_server.py                        # http://127.0.0.1:8765
+    python api_server.py --port 9000 --cache-mb 512
+    python api_server.py --bench                # throughput with concurrent clients
+
+Endpoints (amounts are numbers, dates use the app's %m/%d/%y format):
+
+    GET    /users/<user>/expenses?q=&from=&to=&category=&offset=&limit=
+    POST   /users/<user>/expenses            {"date", "category", "amount", "note"}
+    PUT    /users/<user>/expenses/<id>       {"date", "category", "amount", "note"}
+    DELETE /users/<user>/expenses/<id>
+    GET    /users/<user>/monthly-total?year=&month=
+    GET    /stats
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import expense as app
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 256
+MAX_BODY_BYTES = 1 << 20
+DEFAULT_PAGE = 100
+USERNAME = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+# Rough in-memory cost of a row beyond its columns: the id -> slot map and
+# the date, search and rollup index entries
+INDEX_BYTES_PER_ROW = 220
+ROW_BYTES = 40 + 80 + INDEX_BYTES_PER_ROW   # columns, a typical note, indexes
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# ---------------------- Ledger cache ----------------------
+
+def ledger_bytes(store):
+    """Estimated memory held by `store` and its indexes."""
+    columns = sum(getattr(store, name).itemsize * len(getattr(store, name)) for name in app.ExpenseStore.COLUMNS)
+    strings = sum(len(text) + 50 for text in store.note_pool) + sum(len(c) + 50 for c in store.categories)
+    return columns + strings + len(store) * INDEX_BYTES_PER_ROW
+
+
+class Ledger:
+    """One user's repository and loaded store. `lock` serializes its writes."""
+
+    def __init__(self, username):
+        self.username = username
+        self.repository = app.open_repository(username)
+        self.store = None
+        self.size = 0
+        self.lock = asyncio.Lock()
+        self.active = 0   # requests currently using it; those are never evicted
+
+class LedgerCache:
+    """
+    Loaded ledgers in least-recently-used order. When their estimated size
+    goes over `max_bytes`, the least recently used ones no request is using
+    are dropped; everything they hold is already on disk. Keeping in-use
+    ledgers means a user never has two loaded copies handing out ids.
+    A dropped ledger's repository is closed on a worker thread; loading
+    that user again waits for it, so the two never write at once.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.ledgers = OrderedDict()   # username -> Ledger
+        self.closing = {}              # username -> task closing an evicted ledger's repository
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextlib.asynccontextmanager
+    async def use(self, username):
+        ledger = await self.get(username)
+        ledger.active += 1
+        try:
+            yield ledger
+        finally:
+            ledger.active -= 1
+
+    async def get(self, username):
+        if not USERNAME.match(username):
+            raise ApiError(400, "invalid username")
+        ledger = self.ledgers.get(username)
+        if ledger is not None:
+            self.ledgers.move_to_end(username)
+            if ledger.store is None:
+                # Another request is loading it
+                async with ledger.lock:
+                    pass
+                if ledger.store is None:
+                    raise ApiError(500, f"could not load {username}")
+            self.hits += 1
+            return ledger
+
+        self.misses += 1
+        closing = self.closing.pop(username, None)
+        ledger = self.ledgers[username] = Ledger(username)
+        ledger.active += 1   # not evictable while loading
+        async with ledger.lock:
+            try:
+                if closing is not None:
+                    await asyncio.gather(closing, return_exceptions=True)
+                ledger.store = await asyncio.to_thread(ledger.repository.load)
+            except Exception as e:
+                del self.ledgers[username]
+                ledger.repository.close()
+                raise ApiError(500, f"could not load {username}: {e}")
+            finally:
+                ledger.active -= 1
+            ledger.size = ledger_bytes(ledger.store)
+            self.bytes += ledger.size
+        self.evict(keep=username)
+        return ledger
+
+    def grew(self, ledger, delta):
+        ledger.size += delta
+        self.bytes += delta
+        self.evict(keep=ledger.username)
+
+    def evict(self, keep):
+        for username in list(self.ledgers):
+            if self.bytes <= self.max_bytes:
+                return
+            ledger = self.ledgers[username]
+            if username == keep or ledger.active:
+                continue
+            del self.ledgers[username]
+            self.bytes -= ledger.size
+            self.evictions += 1
+            self.closing[username] = asyncio.ensure_future(asyncio.to_thread(ledger.repository.close))
+
+    async def close(self):
+        """Close every repository, loaded or being closed after eviction."""
+        await asyncio.gather(*self.closing.values(), return_exceptions=True)
+        self.closing.clear()
+        for ledger in self.ledgers.values():
+            await asyncio.to_thread(ledger.repository.close)
+        self.ledgers.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {"users": list(self.ledgers), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+# ---------------------- Handlers ----------------------
+
+def row_json(row):
+    return {"id": row[4], "date": row[0], "category": row[1], "amount": row[2], "note": row[3]}
+
+def parse_expense(body, expense_id):
+    """[date, category, amount, note, id] from a request body, validated."""
+    try:
+        fields = json.loads(body or b"{}")
+        date = datetime.strptime(str(fields["date"]), app.DATE_FORMAT).strftime(app.DATE_FORMAT)
+        amount = float(fields["amount"])
+        app.amount_to_cents(amount)
+        category = str(fields.get("category") or "Other")
+        note = str(fields.get("note", ""))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ApiError(400, f"bad expense: {e}")
+    return [date, category, amount, note, expense_id]
+
+def query_int(query, name, default=None):
+    try:
+        return int(query[name][0]) if name in query else default
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+
+def query_date(query, name):
+    if name not in query:
+        return None
+    try:
+        return app.date_to_ordinal(query[name][0])
+    except ValueError:
+        raise ApiError(400, f"{name} must be a date like {datetime.now().strftime(app.DATE_FORMAT)}")
+
+async def persist(ledger, op, row, undo):
+    """Write one change through the repository, undoing it in memory if that fails."""
+    try:
+        await asyncio.to_thread(ledger.repository.record_many, op, [row])
+    except Exception as e:
+        undo()
+        raise ApiError(500, f"could not save: {e}")
+
+async def list_expenses(ledger, query):
+    store, repository = ledger.store, ledger.repository
+    start, end = query_date(query, "from"), query_date(query, "to")
+    ids = None
+    if "q" in query:
+        ids = repository.search(store, query["q"][0])
+    if start is not None or end is not None:
+        in_range = repository.between(store, start if start is not None else 1, end if end is not None else 10 ** 7)
+        ids = in_range if ids is None else sorted(set(ids).intersection(in_range))
+    if "category" in query:
+        code = store.category_codes.get(query["category"][0])
+        slots = map(store.slot_of, store.ids if ids is None else ids)
+        # Runs without the ledger lock, so skip tombstones rather than compacting
+        ids = [] if code is None else [store.ids[i] for i in slots if i is not None and store.cats[i] == code]
+    total = len(store) if ids is None else len(ids)
+    offset = max(0, query_int(query, "offset", 0))
+    limit = max(0, query_int(query, "limit", DEFAULT_PAGE))
+    if ids is None:
+        rows = store[offset:offset + limit]
+    else:
+        rows = app.ExpenseView(store, ids)[offset:offset + limit]
+    return 200, {"total": total, "offset": offset, "rows": [row_json(row) for row in rows]}
+
+async def add_expense(ledger, body):
+    async with ledger.lock:
+        store = ledger.store
+        row = parse_expense(body, store.next_id)
+        store.append(row)
+        await persist(ledger, "add", row, lambda: store.delete(row[4]))
+    return 201, row_json(row)
+
+async def edit_expense(ledger, expense_id, body):
+    async with ledger.lock:
+        store = ledger.store
+        old = store.get(expense_id)
+        if old is None:
+            raise ApiError(404, f"no expense {expense_id}")
+        row = parse_expense(body, expense_id)
+        store.upsert(row)
+        await persist(ledger, "edit", row, lambda: store.upsert(old))
+    return 200, row_json(row)
+
+async def delete_expense(ledger, expense_id):
+    async with ledger.lock:
+        store = ledger.store
+        row = store.delete(expense_id)
+        if row is None:
+            raise ApiError(404, f"no expense {expense_id}")
+        await persist(ledger, "delete", row, lambda: store.upsert(row))
+    return 200, {"deleted": expense_id}
+
+async def monthly_total(ledger, query):
+    now = datetime.now()
+    year, month = query_int(query, "year", now.year), query_int(query, "month", now.month)
+    if not 1 <= month <= 12:
+        raise ApiError(400, "month must be 1-12")
+    return 200, {"year": year, "month": month,
+                 "total": ledger.repository.month_total(ledger.store, year, month)}
+
+async def route(cache, method, target, body):
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    parts = [p for p in url.path.split("/") if p]
+    if parts == ["stats"] and method == "GET":
+        return 200, cache.stats()
+    if len(parts) < 3 or parts[0] != "users":
+        raise ApiError(404, "not found")
+    if parts[2:] == ["expenses"]:
+        handler = {"GET": lambda ledger: list_expenses(ledger, query),
+                   "POST": lambda ledger: add_expense(ledger, body)}.get(method)
+    elif parts[2] == "expenses" and len(parts) == 4 and parts[3].isdigit():
+        expense_id = int(parts[3])
+        handler = {"PUT": lambda ledger: edit_expense(ledger, expense_id, body),
+                   "DELETE": lambda ledger: delete_expense(ledger, expense_id)}.get(method)
+    elif parts[2:] == ["monthly-total"] and method == "GET":
+        handler = lambda ledger: monthly_total(ledger, query)
+    else:
+        handler = None
+    if handler is None:
+        raise ApiError(404, "not found")
+    async with cache.use(parts[1]) as ledger:
+        size = len(ledger.store)
+        result = await handler(ledger)
+        grown = len(ledger.store) - size
+    if grown:
+        cache.grew(ledger, grown * ROW_BYTES)
+    return result
+
+# ---------------------- HTTP ----------------------
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+async def handle_connection(cache, reader, writer):
+    """Serve HTTP/1.1 requests on one connection, keeping it open between them."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length") or 0)
+            except ValueError:
+                length = -1
+            try:
+                if length < 0:
+                    raise ApiError(400, "invalid Content-Length")
+                if length > MAX_BODY_BYTES:
+                    raise ApiError(413, "request body too large")
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await route(cache, method, target, body)
+            except ApiError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                status, payload = 500, {"error": repr(e)}
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+            data = json.dumps(payload).encode()
+            writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+            await writer.drain()
+            # Without a usable length the rest of the stream can't be framed
+            if not keep_alive or not 0 <= length <= MAX_BODY_BYTES:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+        pass  # client went away, or the server is shutting down
+    finally:
+        writer.close()
+
+async def start_server(host, port, cache_bytes):
+    cache = LedgerCache(cache_bytes)
+    server = await asyncio.start_server(lambda r, w: handle_connection(cache, r, w), host, port)
+    return server, cache
+
+async def serve(host, port, cache_bytes):
+    server, cache = await start_server(host, port, cache_bytes)
+    print(f"serving on http://{host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await cache.close()
+
+# ---------------------- Throughput benchmark ----------------------
+
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    return status, json.loads(await reader.readexactly(length))
+
+async def bench_client(port, users, requests, write_share, latencies, errors, seed):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    today = datetime.now().strftime(app.DATE_FORMAT)
+    try:
+        for n in range(requests):
+            username = users[(seed + n) % len(users)]
+            kind = (seed * 7919 + n * 104729) % 100
+            started = time.perf_counter()
+            if kind < write_share:
+                status, _ = await request(reader, writer, "POST", f"/users/{username}/expenses",
+                                          {"date": today, "category": "Food", "amount": 12.5, "note": f"bench {n}"})
+            elif kind < write_share + (100 - write_share) // 2:
+                status, _ = await request(reader, writer, "GET", f"/users/{username}/monthly-total")
+            else:
+                status, _ = await request(reader, writer, "GET", f"/users/{username}/expenses?q=uber&limit=20")
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+async def run_bench(clients, requests, users, rows, write_share, cache_bytes):
+    """
+    Start a server on a free port over generated ledgers and drive it with
+    `clients` concurrent keep-alive connections. Returns the results.
+    """
+    import benchmark
+    workdir = tempfile.mkdtemp(prefix="expense-api-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        names = [f"bench{i}" for i in range(users)]
+        for i, username in enumerate(names):
+            benchmark.generate_ledger(app.user_csv_filename(username), rows, seed=i)
+        server, cache = await start_server("127.0.0.1", 0, cache_bytes)
+        port = server.sockets[0].getsockname()[1]
+        latencies, errors = [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(bench_client(port, names, requests, write_share, latencies, errors, seed)
+                               for seed in range(clients)))
+        elapsed = time.perf_counter() - started
+        server.close()
+        await server.wait_closed()
+        stats = cache.stats()
+        await cache.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    latencies.sort()
+    return {
+        "clients": clients, "users": users, "rows_per_user": rows, "write_percent": write_share,
+        "requests": len(latencies), "errors": len(errors), "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+        "cache": stats,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON API over the expense ledgers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-mb", type=float, default=DEFAULT_CACHE_MB,
+                        help="memory budget for loaded ledgers (default: %(default)s)")
+    parser.add_argument("--bench", action="store_true", help="run the throughput benchmark and exit")
+    parser.add_argument("--clients", type=int, default=32, help="benchmark: concurrent connections")
+    parser.add_argument("--requests", type=int, default=200, help="benchmark: requests per connection")
+    parser.add_argument("--users", type=int, default=8, help="benchmark: ledgers to spread requests over")
+    parser.add_argument("--rows", type=int, default=10000, help="benchmark: rows per generated ledger")
+    parser.add_argument("--write-percent", type=int, default=20, help="benchmark: share of requests that add")
+    args = parser.parse_args(argv)
+    cache_bytes = int(args.cache_mb * (1 << 20))
+    if args.bench:
+        result = asyncio.run(run_bench(args.clients, args.requests, args.users, args.rows,
+                                       args.write_percent, cache_bytes))
+        print(json.dumps(result, indent=2))
+        return 1 if result["errors"] else 0
+    try:
+        asyncio.run(serve(args.host, args.port, cache_bytes))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
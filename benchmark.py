@@ -0,0 +1,275 @@
+"""
+Headless benchmarks for the expense tracker's hot paths.
+
+Generates synthetic ledgers, times loading, saving, the table, filtering,
+the monthly total and the analytics aggregation on each, and writes a JSON
+report. Tk widgets are replaced by small stand-ins, so no display is needed.
+
+    python benchmark.py                          # 1k, 10k, 100k and 1M rows
+    python benchmark.py --sizes 1000 50000 --out before.json
+    python benchmark.py --compare before.json    # flag slowdowns against an old report
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import expense as app
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+USER = "bench"
+
+# Per category: typical merchants/notes and (low, high) amount range
+LEDGER_PROFILE = {
+    "Food": (("swiggy order", "zomato dinner", "groceries bigbasket", "cafe coffee day", "lunch canteen"), (40, 900)),
+    "Transport": (("uber ride", "ola auto", "metro card recharge", "petrol", "bus pass"), (20, 1500)),
+    " card-Bills": (("credit card bill", "card emi"), (500, 25000)),
+    "Shopping": (("amazon order", "flipkart", "myntra clothes", "local market"), (150, 6000)),
+    "electricity-bills": (("electricity bill", "power bill"), (300, 4000)),
+    "Other": (("gift", "donation", "haircut", "movie tickets", "medicine"), (50, 3000)),
+}
+# Rough share of rows per category
+CATEGORY_WEIGHTS = (45, 25, 3, 15, 2, 10)
+
+# ---------------------- Tk stand-ins ----------------------
+
+class StubTree:
+    """Just enough of ttk.Treeview for sync_table() and friends."""
+
+    def __init__(self):
+        self.items = []
+        self.values = {}
+
+    def get_children(self):
+        return tuple(self.items)
+
+    def insert(self, parent, pos, iid=None, values=()):
+        self.items.insert(len(self.items) if pos == "end" else pos, iid)
+        self.values[iid] = values
+
+    def delete(self, iid):
+        self.items.remove(iid)
+        del self.values[iid]
+
+    def item(self, iid, values=None):
+        if values is None:
+            return {"values": self.values[iid]}
+        self.values[iid] = values
+
+    def move(self, iid, parent, pos):
+        self.items.remove(iid)
+        self.items.insert(pos, iid)
+
+    def bbox(self, iid):
+        return None
+
+    def selection(self):
+        return ()
+
+class StubScrollbar:
+    def set(self, first, last):
+        pass
+
+class StubLabel:
+    def config(self, **options):
+        pass
+
+class StubEntry:
+    def __init__(self, text=""):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+def install_stubs():
+    # load_csv/load_binary time the full load; load_recent times the progressive one
+    app.PROGRESSIVE_LOAD = False
+    app.tree = StubTree()
+    app.vsb = StubScrollbar()
+    app.monthly_total_label = StubLabel()
+    app.budget_label = StubLabel()
+    app.filter_entry = StubEntry()
+    app.table_rows = []
+    app.table_shown = {}
+    app.table_offset = 0
+
+# ---------------------- Synthetic ledgers ----------------------
+
+def generate_ledger(filename, rows, seed=42):
+    """
+    Write a ledger CSV of `rows` expenses spread over the last three years,
+    in the app's own format (%m/%d/%y dates, Id column), oldest first.
+    """
+    rng = random.Random(seed)
+    categories = list(LEDGER_PROFILE)
+    end = datetime.now()
+    days = 3 * 365
+    offsets = sorted(rng.randrange(days) for _ in range(rows))
+    with open(filename, "w", newline="") as f:
+        f.write("Date,Category,Amount,Note,Id\n")
+        for expense_id, offset in enumerate(offsets, 1):
+            category = rng.choices(categories, CATEGORY_WEIGHTS)[0]
+            notes, (low, high) = LEDGER_PROFILE[category]
+            date = (end - timedelta(days=days - 1 - offset)).strftime(app.DATE_FORMAT)
+            amount = round(rng.uniform(low, high), 2)
+            note = f"{rng.choice(notes)} #{rng.randrange(10000)}"
+            f.write(f"{date},{category},{amount},{note},{expense_id}\n")
+
+# ---------------------- Timing ----------------------
+
+def measure(fn, repeat, setup=None):
+    """min/median seconds of `fn()` over `repeat` runs, `setup()` untimed before each."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        began = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - began)
+    return {"min": round(min(times), 6), "median": round(statistics.median(times), 6)}
+
+def bench_size(rows, repeat, workdir):
+    """Time every operation on a fresh ledger of `rows` expenses."""
+    csv_name = app.user_csv_filename(USER)
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    generate_ledger(csv_name, rows)
+    install_stubs()
+    app.current_user = USER
+    results = {}
+
+    def load():
+        app.repository = app.CsvRepository(USER)
+        app.load_expenses()
+
+    def drop_binary():
+        if os.path.exists(app.binary_filename(csv_name)):
+            os.remove(app.binary_filename(csv_name))
+
+    results["load_csv"] = measure(load, repeat, setup=drop_binary)
+    # Time to interactive with progressive loading: only the newest part is read
+    since = app.date_to_ordinal(datetime.now().strftime(app.DATE_FORMAT)) - 62
+    if app.CsvRepository(USER).load_recent(since) is None:
+        # Below PROGRESSIVE_MIN_BYTES the app loads everything; nothing to time
+        results["load_recent"] = None
+    else:
+        results["load_recent"] = measure(lambda: app.CsvRepository(USER).load_recent(since), repeat)
+    if app.BINARY_SNAPSHOTS:
+        load()   # leaves a fresh .bin behind
+        results["load_binary"] = measure(load, repeat)
+
+    # No I/O worker is running, so submit_io() writes synchronously
+    results["save_snapshot"] = measure(app.repository.compact, repeat)
+
+    def add_one():
+        row = [datetime.now().strftime(app.DATE_FORMAT), "Food", 123.45, "benchmark add", app.expenses.next_id]
+        app.expenses.append(row)
+        app.update_table()
+        app.repository.record("add", row)
+    results["add_expense"] = measure(add_one, repeat)
+
+    def reset_table():
+        app.tree = StubTree()
+        app.table_shown = {}
+        app.table_rows = []
+    results["update_table"] = measure(app.update_table, repeat, setup=reset_table)
+    results["scroll_page"] = measure(lambda: app.scroll_table("scroll", 1, "pages"), repeat)
+
+    for keyword in ("food", "uber", "#123", "zz"):
+        app.filter_entry.text = keyword
+        results[f"filter[{keyword}]"] = measure(app.filter_expenses, repeat)
+    app.update_table()
+
+    results["update_monthly_total"] = measure(app.update_monthly_total, repeat)
+
+    try:
+        app.heavy_import("numpy")
+    except ImportError:
+        results["analytics_summary"] = None
+    else:
+        results["analytics_summary"] = measure(lambda: app.analytics_summary(app.expenses), repeat)
+    return results
+
+# ---------------------- Report ----------------------
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(report, baseline, threshold):
+    """Print each operation's median against `baseline`; returns the number of regressions."""
+    regressions = 0
+    for size, ops in report["results"].items():
+        old_ops = baseline["results"].get(size, {})
+        for op, timing in ops.items():
+            old = old_ops.get(op)
+            if not timing or not old:
+                continue
+            ratio = timing["median"] / old["median"] if old["median"] else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  <-- slower"
+                regressions += 1
+            print(f"{size:>8} {op:<24} {old['median'] * 1000:10.2f} ms -> {timing['median'] * 1000:10.2f} ms"
+                  f"  x{ratio:.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the expense tracker's hot paths headlessly.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="ledger sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per operation (min and median are kept)")
+    parser.add_argument("--out", default="benchmark.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown ratio above which --compare reports a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    out = os.path.abspath(args.out)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="expense-bench-")
+    try:
+        os.chdir(workdir)
+        for rows in args.sizes:
+            began = time.perf_counter()
+            report["results"][str(rows)] = bench_size(rows, args.repeat, workdir)
+            print(f"{rows} rows done in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold) else 0
+    for size, ops in report["results"].items():
+        for op, timing in ops.items():
+            if timing:
+                print(f"{size:>8} {op:<24} {timing['median'] * 1000:10.2f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,831 @@
+import time
+STARTUP_BEGAN = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from tkcalendar import DateEntry, Calendar
+import argparse
+import cProfile
 import csv
+import gzip
+import importlib
+import itertools
+import json
+import math
+import mmap
+import sqlite3
+import struct
+import base64
+import contextlib
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+import functools
 import os
-from fpdf import FPDF
+import queue
+import sys
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 import io
-import matplotlib
-matplotlib.use("Agg")  # use non-interactive backend for PDF-safe rendering
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
+# tkcalendar, fpdf and matplotlib are imported on first use (see heavy_import)
+# so the login window doesn't wait for them.
+
+# --------------------- Startup timing ---------------------
+
+# EXPENSE_STARTUP_TIMING=1 prints how long each startup phase and each
+# deferred import took, to stderr.
+STARTUP_TIMING = os.environ.get("EXPENSE_STARTUP_TIMING") == "1"
+# EXPENSE_PREWARM=0 turns off importing the heavy modules in the background
+# while the login window is up.
+PREWARM_IMPORTS = os.environ.get("EXPENSE_PREWARM", "1") != "0"
+_last_startup_mark = STARTUP_BEGAN
+
+def mark_startup(phase):
+    global _last_startup_mark
+    if not STARTUP_TIMING:
+        return
+    now = time.perf_counter()
+    print(f"[startup] {phase:<32} +{(now - _last_startup_mark) * 1000:8.1f} ms"
+          f"   total {(now - STARTUP_BEGAN) * 1000:8.1f} ms", file=sys.stderr)
+    _last_startup_mark = now
+
+def heavy_import(name):
+    """
+    Import `name` the first time it is needed and return the module.
+    Always goes through import_module(): a module the prewarm thread is
+    still importing is already in sys.modules but not finished, and the
+    import machinery waits for it.
+    """
+    first = name not in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    if first and STARTUP_TIMING:
+        where = "" if threading.current_thread() is threading.main_thread() else " (background)"
+        print(f"[startup] import {name}{where}: {(time.perf_counter() - started) * 1000:.1f} ms",
+              file=sys.stderr)
+    return module
+
+def load_matplotlib():
+    """Return (Figure, FigureCanvasAgg), importing matplotlib if needed."""
+    matplotlib = heavy_import("matplotlib")
+    if "matplotlib.pyplot" not in sys.modules:
+        matplotlib.use("Agg")  # use non-interactive backend for PDF-safe rendering
+    figure = heavy_import("matplotlib.figure")
+    backend = heavy_import("matplotlib.backends.backend_agg")
+    return figure.Figure, backend.FigureCanvasAgg
+
+def prewarm_imports():
+    """Pull in the heavy modules on a background thread while the user logs in."""
+    def work():
+        try:
+            heavy_import("tkcalendar")
+            heavy_import("fpdf")
+            heavy_import("numpy")
+            load_matplotlib()
+        except Exception:
+            pass  # the real import on first use will report it
+    threading.Thread(target=work, name="expense-prewarm", daemon=True).start()
+
+# --------------------- Instrumentation ---------------------
+
+# Handlers decorated with @instrumented record call counts and latencies in
+# handler_stats; Ctrl+Shift+D opens a window with them. Handlers that open
+# a dialog aren't decorated, as the time the user spends in it would count;
+# their worker functions are. On exit the stats are
+# written to METRICS_FILE (EXPENSE_METRICS_FILE; empty turns it off).
+# EXPENSE_PROFILE=<file> also runs the handlers called on the UI thread
+# under cProfile and writes the stats there on exit (load with pstats).
+METRICS_FILE = os.environ.get("EXPENSE_METRICS_FILE", "expense_metrics.json")
+PROFILE_FILE = os.environ.get("EXPENSE_PROFILE", "")
+METRICS_WINDOW = 1000   # recent calls kept per handler for the histogram
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, float("inf"))
+
+class HandlerStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=METRICS_WINDOW)
+
+    def add(self, seconds, failed):
+        self.calls += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def histogram(self):
+        """Counts of the recent calls per LATENCY_BUCKETS_MS bucket."""
+        counts = [0] * len(LATENCY_BUCKETS_MS)
+        for seconds in self.recent:
+            counts[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        return counts
+
+    def percentile(self, p):
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.calls * 1000, 3) if self.calls else 0.0,
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "histogram": dict(zip(map(str, LATENCY_BUCKETS_MS), self.histogram())),
+        }
+
+handler_stats = {}               # qualified function name -> HandlerStats
+handler_stats_lock = threading.Lock()
+profiler = None                  # cProfile.Profile when PROFILE_FILE is set
+_profile_depth = 0               # nesting of instrumented calls on the UI thread
+
+def instrumented(fn):
+    """Record the latency of every call of `fn` in handler_stats."""
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        global profiler, _profile_depth
+        profiling = PROFILE_FILE and threading.current_thread() is threading.main_thread()
+        if profiling:
+            if profiler is None:
+                profiler = cProfile.Profile()
+            if _profile_depth == 0:
+                profiler.enable()
+            _profile_depth += 1
+        failed = True
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiling:
+                _profile_depth -= 1
+                if _profile_depth == 0:
+                    profiler.disable()
+            with handler_stats_lock:
+                stats = handler_stats.get(name)
+                if stats is None:
+                    stats = handler_stats[name] = HandlerStats()
+                stats.add(elapsed, failed)
+    return wrapper
+
+def metrics_report():
+    with handler_stats_lock:
+        return {name: stats.summary() for name, stats in sorted(handler_stats.items())}
+
+def dump_metrics():
+    """Write the handler metrics (and the cProfile stats, if any) on exit."""
+    if METRICS_FILE:
+        try:
+            with open(METRICS_FILE, "w") as f:
+                json.dump({"user": current_user, "saved": datetime.now().isoformat(timespec="seconds"),
+                           "handlers": metrics_report()}, f, indent=2)
+        except OSError:
+            pass  # diagnostics only
+    if profiler is not None:
+        try:
+            profiler.dump_stats(PROFILE_FILE)
+        except OSError:
+            pass
+
+# --------------------- Expense store ---------------------
+
+DATE_FORMAT = "%m/%d/%y"
+_date_ordinals = {}   # "01/31/24" -> proleptic ordinal
+_date_texts = {}      # proleptic ordinal -> "01/31/24"
+
+def date_to_ordinal(text):
+    ordinal = _date_ordinals.get(text)
+    if ordinal is None:
+        ordinal = datetime.strptime(text, DATE_FORMAT).toordinal()
+        _date_ordinals[text] = ordinal
+        _date_texts[ordinal] = text
+    return ordinal
+
+# Amounts are kept as cents in a signed 64-bit column
+MAX_CENTS = 2 ** 63 - 1
+
+def amount_to_cents(amount):
+    """Cents of `amount`; ValueError if it isn't finite or doesn't fit the column."""
+    cents = float(amount) * 100
+    if not math.isfinite(cents) or not -MAX_CENTS <= round(cents) <= MAX_CENTS:
+        raise ValueError(f"amount out of range: {amount}")
+    return round(cents)
+
+def ordinal_to_date(ordinal):
+    text = _date_texts.get(ordinal)
+    if text is None:
+        text = datetime.fromordinal(ordinal).strftime(DATE_FORMAT)
+        _date_texts[ordinal] = text
+        _date_ordinals[text] = ordinal
+    return text
+
+_ordinal_months = {}  # proleptic ordinal -> (year, month)
+
+def ordinal_month(ordinal):
+    month = _ordinal_months.get(ordinal)
+    if month is None:
+        dt = datetime.fromordinal(ordinal)
+        month = _ordinal_months[ordinal] = (dt.year, dt.month)
+    return month
+
+def month_bounds(year, month):
+    """Ordinals [first day of month, first day of next month)."""
+    start = datetime(year, month, 1).toordinal()
+    if month == 12:
+        return start, datetime(year + 1, 1, 1).toordinal()
+    return start, datetime(year, month + 1, 1).toordinal()
+
+class StoreIndex:
+    """Base for the indexes an ExpenseStore keeps in step with its rows."""
+
+    def build(self, store):
+        for i in range(len(store)):
+            self.add(store, i)
+
+class RollupIndex(StoreIndex):
+    """
+    Running totals per (year, month), per category and per day.
+    Amounts are summed as integer cents, so the totals are exactly what a
+    full scan would produce. Each entry is [cents, row count]; entries whose
+    count drops to zero are removed.
+    """
+
+    def __init__(self):
+        self.months = {}       # (year, month) -> [cents, count]
+        self.categories = {}   # category -> [cents, count]
+        self.days = {}         # ordinal -> [cents, count]
+
+    def build(self, store):
+        # Sum per day and per category in two tight loops; months follow from days
+        day_cents = defaultdict(int)
+        cat_cents = defaultdict(int)
+        for ordinal, cents in zip(store.dates, store.cents):
+            day_cents[ordinal] += cents
+        for cat, cents in zip(store.cats, store.cents):
+            cat_cents[cat] += cents
+        self.days = {d: [day_cents[d], n] for d, n in Counter(store.dates).items()}
+        self.categories = {store.categories[c]: [cat_cents[c], n] for c, n in Counter(store.cats).items()}
+        self.months = {}
+        for ordinal, (cents, count) in sorted(self.days.items()):
+            entry = self.months.setdefault(ordinal_month(ordinal), [0, 0])
+            entry[0] += cents
+            entry[1] += count
+
+    def add(self, store, i):
+        self._apply(store, i, 1)
+
+    def remove(self, store, i):
+        self._apply(store, i, -1)
+
+    def _apply(self, store, i, sign):
+        ordinal = store.dates[i]
+        cents = sign * store.cents[i]
+        keys = ((self.months, ordinal_month(ordinal)),
+                (self.categories, store.categories[store.cats[i]]),
+                (self.days, ordinal))
+        for table, key in keys:
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [0, 0]
+            entry[0] += cents
+            entry[1] += sign
+            if entry[1] == 0:
+                del table[key]
+
+    def month_total(self, year, month):
+        return self.months.get((year, month), (0, 0))[0] / 100
+
+    def category_totals(self):
+        return {category: cents / 100 for category, (cents, _) in self.categories.items()}
+
+    def monthly_totals(self):
+        """[((year, month), total), ...] in calendar order."""
+        return [(key, cents / 100) for key, (cents, _) in sorted(self.months.items())]
+
+class NgramIndex(StoreIndex):
+    """
+    Trigram inverted index over lower-cased notes, for substring search
+    without scanning every row.
+    Postings point at note codes of the store's string pool rather than at
+    rows, since most notes repeat; each note code maps to the ids of the
+    rows that carry it. Categories are few, so they are matched directly.
+    """
+
+    N = 3
+
+    def __init__(self):
+        self.postings = {}       # trigram -> set of note codes
+        self.rows_by_note = {}   # note code -> set of ids
+
+    def grams(self, text):
+        return {text[i:i + self.N] for i in range(len(text) - self.N + 1)}
+
+    def build(self, store):
+        rows_by_note = defaultdict(set)
+        for code, expense_id in zip(store.notes, store.ids):
+            rows_by_note[code].add(expense_id)
+        self.rows_by_note = dict(rows_by_note)
+        self.postings = {}
+        for code in self.rows_by_note:
+            for gram in self.grams(store.note_pool[code].lower()):
+                self.postings.setdefault(gram, set()).add(code)
+
+    def add(self, store, i):
+        code = store.notes[i]
+        ids = self.rows_by_note.get(code)
+        if ids is None:
+            ids = self.rows_by_note[code] = set()
+            for gram in self.grams(store.note_pool[code].lower()):
+                self.postings.setdefault(gram, set()).add(code)
+        ids.add(store.ids[i])
+
+    def remove(self, store, i):
+        code = store.notes[i]
+        ids = self.rows_by_note.get(code)
+        if ids is None:
+            return
+        ids.discard(store.ids[i])
+        if not ids:
+            del self.rows_by_note[code]
+            for gram in self.grams(store.note_pool[code].lower()):
+                codes = self.postings.get(gram)
+                codes.discard(code)
+                if not codes:
+                    del self.postings[gram]
+
+    def search(self, store, keyword):
+        """Sorted ids of the rows whose category or note contains `keyword`."""
+        keyword = keyword.lower()
+        grams = self.grams(keyword)
+        if grams:
+            codes = None
+            for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+                codes = set(self.postings.get(gram, ())) if codes is None else codes & self.postings[gram]
+                if not codes:
+                    break
+        else:
+            # Too short for a trigram: check each distinct note instead
+            codes = self.rows_by_note
+        matched = set()
+        for code in codes:
+            if keyword in store.note_pool[code].lower():
+                matched.update(self.rows_by_note[code])
+
+        cat_codes = {code for code, category in enumerate(store.categories) if keyword in category.lower()}
+        if cat_codes:
+            # Tombstoned slots keep their old columns, so check the id is still there
+            matched.update(x for x, c in zip(store.ids, store.cats) if c in cat_codes and x in store.slots)
+        return sorted(matched)
+
+class DateIndex(StoreIndex):
+    """
+    Expense ids sorted by date, for day/week/month/range lookups in
+    O(log n + k). Each entry packs (ordinal, id) into a single integer, so
+    the whole index is one sorted array that bisect works on directly.
+    """
+
+    ID_BITS = 40
+    ID_MASK = (1 << ID_BITS) - 1
+
+    def __init__(self):
+        self.keys = array("q")
+
+    def _key(self, store, i):
+        return (store.dates[i] << self.ID_BITS) | store.ids[i]
+
+    def build(self, store):
+        self.keys = array("q", sorted((d << self.ID_BITS) | x for d, x in zip(store.dates, store.ids)))
+
+    def add(self, store, i):
+        key = self._key(store, i)
+        self.keys.insert(bisect_left(self.keys, key), key)
+
+    def remove(self, store, i):
+        key = self._key(store, i)
+        j = bisect_left(self.keys, key)
+        if j < len(self.keys) and self.keys[j] == key:
+            del self.keys[j]
+
+    def between(self, start, end):
+        """Ids dated from ordinal `start` to `end` inclusive, oldest first."""
+        lo = bisect_left(self.keys, start << self.ID_BITS)
+        hi = bisect_left(self.keys, (end + 1) << self.ID_BITS)
+        return [key & self.ID_MASK for key in self.keys[lo:hi]]
+
+    def ordered_ids(self):
+        """All ids, oldest date first."""
+        return [key & self.ID_MASK for key in self.keys]
+
+    def day(self, ordinal):
+        return self.between(ordinal, ordinal)
+
+    def month(self, year, month):
+        start, end = month_bounds(year, month)
+        return self.between(start, end - 1)
+
+class ExpenseView:
+    """
+    Read-only, list-like subset of an ExpenseStore, addressed by expense id.
+    Rows are only materialized when the table asks for them.
+    `query(store)`, when given, recomputes the ids over another store, so the
+    view can be rebuilt once the full history has loaded.
+    """
+
+    def __init__(self, store, ids, query=None):
+        self.store = store
+        self.ids = ids
+        self.query = query
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for expense_id in self.ids:
+            yield self.store.row(self.store.slot_of(expense_id))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.store.row(self.store.slot_of(x)) for x in self.ids[i]]
+        return self.store.row(self.store.slot_of(self.ids[i]))
+
+def drop_slots(column, slots):
+    """Copy of array `column` without the ascending `slots`."""
+    kept = array(column.typecode)
+    start = 0
+    for i in slots:
+        kept += column[start:i]
+        start = i + 1
+    kept += column[start:]
+    return kept
+
+# Every change to any store takes a fresh number, so (store, contents) can be
+# told apart by `version` alone, e.g. to key cached charts.
+_store_versions = itertools.count(1)
+
+class ExpenseStore:
+    """
+    Column-oriented expense storage.
+    Dates are kept as day ordinals, amounts as integer cents, categories as
+    codes into an interned table and notes as indexes into a string pool.
+    Indexing/iterating yields [date, category, amount, note, id] lists, so
+    code written against the old list of rows keeps working.
+    Every index in `indexes` is told about each row as it is added/removed.
+    Rows are found by id through `slots` (id -> slot). New ids are larger
+    than existing ones and rows are only appended, so `ids` stays sorted.
+    `next_id` is one more than the largest id this ledger ever held; it
+    doesn't go down when rows are deleted, so ids are never handed out twice.
+    Deleting a row only tombstones its slot; the columns are compacted once
+    enough slots are dead (or before an index is rebuilt), so a delete does
+    not shift every column. Indexing, slicing and iterating skip tombstones.
+    """
+
+    def __init__(self, rows=()):
+        self.dates = array("i")
+        self.cents = array("q")
+        self.cats = array("H")
+        self.notes = array("I")
+        self.ids = array("q")
+        self.slots = {}           # id -> slot of the live rows
+        self.dead = []            # tombstoned slots, ascending
+        self.next_id = 1          # id high-water mark, see above
+        self.categories = []      # code -> category name
+        self.category_codes = {}  # category name -> code
+        self.note_pool = []       # note index -> text
+        self.note_codes = {}      # text -> note index
+        self.version = next(_store_versions)
+        self.rollup = RollupIndex()
+        self.search = NgramIndex()
+        self.by_date = DateIndex()
+        self.indexes = [self.rollup, self.search, self.by_date]
+        for row in rows:
+            self._append_columns(row)
+        self.slots = dict(zip(self.ids, range(len(self.ids))))
+        self.next_id = self.ids[-1] + 1 if self.ids else 1
+        for index in self.indexes:
+            index.build(self)
+
+    def category_code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self.category_codes[category] = code
+        return code
+
+    def note_code(self, note):
+        code = self.note_codes.get(note)
+        if code is None:
+            code = len(self.note_pool)
+            self.note_pool.append(note)
+            self.note_codes[note] = code
+        return code
+
+    def _columns(self, row):
+        # Everything that can fail runs before any column is touched
+        return (date_to_ordinal(row[0]), amount_to_cents(row[2]),
+                self.category_code(row[1]), self.note_code(row[3]), row[4])
+
+    def row(self, i):
+        return [ordinal_to_date(self.dates[i]), self.categories[self.cats[i]],
+                self.cents[i] / 100, self.note_pool[self.notes[i]], self.ids[i]]
+
+    def slot_of(self, expense_id):
+        return self.slots.get(expense_id)
+
+    def get(self, expense_id):
+        """Row with id `expense_id`, or None."""
+        i = self.slots.get(expense_id)
+        return None if i is None else self.row(i)
+
+    def _slot(self, position):
+        # Slot of the `position`-th live row: skip the tombstones before it
+        if not self.dead:
+            return position
+        lo, hi = 0, len(self.dead)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.dead[mid] - mid <= position:
+                lo = mid + 1
+            else:
+                hi = mid
+        return position + lo
+
+    def _position(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("expense index out of range")
+        return self._slot(i)
+
+    def __len__(self):
+        return len(self.ids) - len(self.dead)
+
+    def __iter__(self):
+        dead = set(self.dead)
+        for i in range(len(self.ids)):
+            if i not in dead:
+                yield self.row(i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(self._slot(j)) for j in range(*i.indices(len(self)))]
+        return self.row(self._position(i))
+
+    def __setitem__(self, i, row):
+        self._replace(self._position(i), row)
+
+    def _replace(self, i, row):
+        columns = self._columns(row)
+        for index in self.indexes:
+            index.remove(self, i)
+        del self.slots[self.ids[i]]
+        (self.dates[i], self.cents[i], self.cats[i],
+         self.notes[i], self.ids[i]) = columns
+        self.slots[self.ids[i]] = i
+        self.version = next(_store_versions)
+        for index in self.indexes:
+            index.add(self, i)
+
+    def _append_columns(self, row):
+        ordinal, cents, cat, note, expense_id = self._columns(row)
+        self.dates.append(ordinal)
+        self.cents.append(cents)
+        self.cats.append(cat)
+        self.notes.append(note)
+        self.ids.append(expense_id)
+
+    def append(self, row):
+        self._append_columns(row)
+        self.slots[self.ids[-1]] = len(self.ids) - 1
+        self.next_id = max(self.next_id, self.ids[-1] + 1)
+        self.version = next(_store_versions)
+        for index in self.indexes:
+            index.add(self, len(self.ids) - 1)
+
+    def extend(self, rows):
+        """
+        Append many rows (ids above the existing ones). A large batch
+        rebuilds each index once instead of updating it row by row.
+        """
+        self.compact()
+        start = len(self.ids)
+        for row in rows:
+            self._append_columns(row)
+        added = len(self.ids) - start
+        if not added:
+            return
+        self.slots.update(zip(self.ids[start:], range(start, len(self.ids))))
+        self.next_id = max(self.next_id, self.ids[-1] + 1)
+        self.version = next(_store_versions)
+        if added * 8 >= len(self.ids):
+            for index in self.indexes:
+                index.build(self)
+        else:
+            for i in range(start, len(self.ids)):
+                for index in self.indexes:
+                    index.add(self, i)
+
+    def delete(self, expense_id):
+        """Remove the row with id `expense_id`; returns it, or None if there is none."""
+        i = self.slots.get(expense_id)
+        if i is None:
+            return None
+        row = self.row(i)
+        for index in self.indexes:
+            index.remove(self, i)
+        del self.slots[expense_id]
+        insort(self.dead, i)
+        self.version = next(_store_versions)
+        if len(self.dead) * 8 >= len(self.ids):
+            self.compact()
+        return row
+
+    def pop(self, i=-1):
+        return self.delete(self.ids[self._position(i)])
+
+    def compact(self):
+        """Drop the tombstoned slots. Indexes hold ids, not slots, so they stay valid."""
+        if not self.dead:
+            return
+        for name in self.COLUMNS:
+            setattr(self, name, drop_slots(getattr(self, name), self.dead))
+        self.dead = []
+        self.slots = dict(zip(self.ids, range(len(self.ids))))
+
+    COLUMNS = ("dates", "cents", "cats", "notes", "ids")
+
+    @classmethod
+    def from_columns(cls, columns, categories, note_pool, indexed=True):
+        """Store over ready-made column arrays (e.g. read from a binary snapshot)."""
+        store = cls()
+        for name, column in zip(cls.COLUMNS, columns):
+            setattr(store, name, column)
+        store.categories = categories
+        store.category_codes = {c: code for code, c in enumerate(categories)}
+        store.note_pool = note_pool
+        store.note_codes = {n: code for code, n in enumerate(note_pool)}
+        store.slots = dict(zip(store.ids, range(len(store.ids))))
+        store.next_id = store.ids[-1] + 1 if store.ids else 1
+        if indexed:
+            for index in store.indexes:
+                index.build(store)
+        else:
+            store.indexes = []
+        return store
+
+    def snapshot(self):
+        """
+        Copy of the live rows, without indexes, that stays valid while this
+        store keeps changing. Copying the columns is a handful of memcpy calls.
+        This store itself is left as it is, so the copy can be taken off the
+        main thread while it is being read.
+        """
+        columns = [drop_slots(getattr(self, name), self.dead) for name in self.COLUMNS]
+        copy = ExpenseStore.from_columns(columns, list(self.categories), list(self.note_pool), indexed=False)
+        copy.next_id = self.next_id
+        return copy
+
+    def upsert(self, row):
+        """Replace the row with row[4]'s id, or insert it where its id sorts."""
+        i = self.slot_of(row[4])
+        if i is not None:
+            self._replace(i, row)
+            return
+        if self.ids and row[4] > self.ids[-1]:
+            self.append(row)
+            return
+        # Out-of-order insert (journal replay, undo): shifts the later slots
+        self.compact()
+        i = bisect_left(self.ids, row[4])
+        for column, value in zip((self.dates, self.cents, self.cats, self.notes, self.ids), self._columns(row)):
+            column.insert(i, value)
+        for j in range(i, len(self.ids)):
+            self.slots[self.ids[j]] = j
+        self.next_id = max(self.next_id, row[4] + 1)
+        self.version = next(_store_versions)
+        for index in self.indexes:
+            index.add(self, i)
 
 # -----------------------
 # Final: per-user CSV isolation + UI features
 # -----------------------
 
-expenses = []
+CATEGORIES = ["Food", "Transport", " card-Bills", "Shopping", "electricity-bills", "Other"]
+
+expenses = ExpenseStore()   # rows of [date, category, amount, note, id]
 current_user = None   # holds the logged-in username
+repository = None     # storage backend of the logged-in user (see open_repository)
+
+# Progressive loading (EXPENSE_PROGRESSIVE_LOAD=0 turns it off): while the
+# older history is read in the background, `expenses` holds only the recent
+# part and the changes made meanwhile are kept in history_changes.
+PROGRESSIVE_LOAD = os.environ.get("EXPENSE_PROGRESSIVE_LOAD", "1") != "0"
+history_loading = False
+history_changes = []  # (op, row) recorded while history_loading
+
+budgets = None        # BudgetIndex of the logged-in user, loaded by load_expenses()
+HISTORY_POLL_MS = 100
+
+# Table view state. Only the rows that fit in the viewport are materialized
+# as Treeview items; the rest live in `table_rows` and are swapped in as the
+# user scrolls.
+table_rows = []       # rows currently shown (all expenses or a filter result)
+table_offset = 0      # index in table_rows of the first materialized row
+table_visible = 20    # rows that fit in the viewport
+table_shown = {}      # iid -> values of the materialized Treeview items
+TABLE_ROW_HEIGHT = 28
+
+# Writes are handed to a background thread, which batches whatever arrives
+# within SAVE_COALESCE_MS into one write per file.
+io_queue = queue.Queue()
+io_errors = queue.Queue()   # messages from the worker, shown by poll_io_errors()
+io_thread = None
+SAVE_COALESCE_MS = int(os.environ.get("EXPENSE_SAVE_WINDOW_MS", "300"))
+IO_ERROR_POLL_MS = 250
+
+live_search_job = None     # pending root.after() id of the search-as-you-type query
+LIVE_SEARCH_DELAY_MS = 250
+
+# The CSV journal is folded back into the snapshot CSV once it holds this many
+# records (or as many records as there are expenses, whichever is larger),
+# so compaction stays amortised O(1) per change.
+JOURNAL_COMPACT_MIN = 500
 
 # --------------------- Core functions ---------------------
 
+@instrumented
 def add_expense():
     try:
         amount = float(amount_entry.get())
+        amount_to_cents(amount)
         category = category_var.get()
-        date = date_entry.get_date().strftime("%m/%d/%y")
+        date = date_entry.get_date().strftime(DATE_FORMAT)
         note = note_entry.get()
-        expenses.append([date, category, float(amount), note])
+        row = [date, category, float(amount), note, expenses.next_id]
+        expenses.append(row)
         update_table()
-        save_to_csv()
+        if not record_change("add", [row], lambda: expenses.delete(row[4])):
+            return
         update_monthly_total()
         clear_fields()
     except ValueError:
         messagebox.showerror("Invalid Input", "Amount must be a number")
 
+@instrumented
 def edit_expense():
     selected = tree.selection()
     if not selected:
         messagebox.showwarning("No Selection", "Please select an expense to edit.")
         return
 
-    index = tree.index(selected[0])
+    # Treeview iids are expense ids, so this holds under any filter or view
+    expense_id = int(selected[0])
+    if expenses.slot_of(expense_id) is None:
+        return
     try:
         amount = float(amount_entry.get())
+        amount_to_cents(amount)
     except ValueError:
         messagebox.showerror("Invalid Input", "Amount must be a number.")
         return
 
     category = category_var.get()
-    date = date_entry.get_date().strftime("%m/%d/%y")
+    date = date_entry.get_date().strftime(DATE_FORMAT)
     note = note_entry.get()
 
-    expenses[index] = [date, category, float(amount), note]
+    row = [date, category, float(amount), note, expense_id]
+    old = expenses.get(expense_id)
+    expenses.upsert(row)
     update_table()
-    save_to_csv()
+    if not record_change("edit", [row], lambda: expenses.upsert(old)):
+        return
     update_monthly_total()
     clear_fields()
 
-def populate_fields_for_edit(event=None, index=None):
-    if index is None:
+def populate_fields_for_edit(event=None, expense_id=None):
+    if expense_id is None:
         selected = tree.selection()
         if not selected:
             return
         values = tree.item(selected[0])["values"]
     else:
-        values = expenses[index]
+        values = expenses.get(expense_id)
+        if values is None:
+            return
     # values might have formatted amount string; handle both
-    date_entry.set_date(datetime.strptime(values[0], "%m/%d/%y"))
+    date_entry.set_date(datetime.strptime(values[0], DATE_FORMAT))
     category_var.set(values[1])
     amount_entry.delete(0, tk.END)
     amount_entry.insert(0, str(values[2]))
@@ -77,189 +836,2218 @@ def clear_fields():
     amount_entry.delete(0, tk.END)
     note_entry.delete(0, tk.END)
 
-def save_to_csv():
+def user_csv_filename(username):
     """
-    Save expenses to the current user's CSV file.
-    Falls back to 'expenses.csv' if current_user is None (safety).
+    Snapshot CSV of `username`.
+    Falls back to 'expenses.csv' if username is None (safety).
     """
-    filename = f"expenses_{current_user}.csv" if current_user else "expenses.csv"
-    try:
-        with open(filename, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Date", "Category", "Amount", "Note"])
-            writer.writerows(expenses)
-    except Exception as e:
-        messagebox.showerror("File Error", f"Could not save CSV: {e}")
+    return f"expenses_{username}.csv" if username else "expenses.csv"
 
-def load_from_csv():
+def write_snapshot(filename, rows):
     """
-    Load expenses from the current user's CSV file.
-    Clears the global expenses list before loading.
+    Write `rows` as the snapshot CSV `filename`.
+    The snapshot is written to a temporary file and renamed over the old one,
+    so a crash mid-write never leaves a truncated CSV behind.
+    """
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Category", "Amount", "Note", "Id"])
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+    if BINARY_SNAPSHOTS and isinstance(rows, ExpenseStore):
+        try:
+            write_binary_snapshot(filename, rows)
+        except OSError:
+            pass  # only a cache: the next load falls back to the CSV
+
+def reset_journal(filename, next_id):
+    """
+    Start an empty journal after a snapshot. Its only record is the id
+    high-water mark, which the snapshot rows alone can't show once the
+    newest expenses were deleted. Replaced atomically, like the snapshot.
+    """
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, "w") as f:
+        f.write(json.dumps({"op": "next_id", "id": next_id}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+def write_journal(filename, lines):
+    with open(filename, "a") as f:
+        f.write("".join(lines))
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_journal(journal_name, repair=True):
     """
-    global expenses
-    expenses = []  # clear previous data to avoid mixing users
-    filename = f"expenses_{current_user}.csv" if current_user else "expenses.csv"
+    The records of journal `journal_name` as (op, row) changes.
+    A torn last line (crash during append) ends the journal and, if
+    `repair`, is cut off, so later appends don't get glued onto it.
+    """
+    changes = []
+    good_end = 0
     try:
-        with open(filename, newline="") as f:
-            reader = csv.reader(f)
-            next(reader, None)
-            for row in reader:
-                if len(row) >= 4:
-                    try:
-                        row[2] = float(row[2])
-                    except:
-                        row[2] = 0.0
-                    expenses.append(row)
+        with open(journal_name, "rb+" if repair else "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                    expense_id = int(record["id"])
+                    if record["op"] in ("delete", "next_id"):
+                        changes.append((record["op"], [None, None, None, None, expense_id]))
+                    else:
+                        date, category, amount, note = record["row"]
+                        changes.append((record["op"], [date, category, float(amount), note, expense_id]))
+                except (ValueError, KeyError, TypeError):
+                    if repair:
+                        f.truncate(good_end)
+                    break
+                good_end += len(line)
     except FileNotFoundError:
-        # No file yet: that's fine — user has empty list
         pass
+    return changes
+
+def apply_changes(store, changes):
+    """Apply (op, row) changes to `store`; each is keyed by id, so re-applying is harmless."""
+    for op, row in changes:
+        if op == "next_id":
+            store.next_id = max(store.next_id, row[4])
+        elif op == "delete":
+            store.delete(row[4])
+            store.next_id = max(store.next_id, row[4] + 1)
+        else:
+            store.upsert(row)
+
+def journal_changes(changes):
+    """How many of `changes` change expenses; the id mark left by a compaction doesn't."""
+    return sum(op != "next_id" for op, _ in changes)
+
+def replay_journal(journal_name, store):
+    """
+    Apply the records of journal `journal_name` on top of the snapshot
+    loaded into `store`. Returns the number of changes applied.
+    """
+    changes = read_journal(journal_name)
+    apply_changes(store, changes)
+    return journal_changes(changes)
+
+def parse_snapshot_rows(reader, rejected=None):
+    """
+    Rows of a snapshot CSV reader, with amounts as floats; the id is None
+    when missing. Rows whose date can't be read or whose amount can't be
+    stored (inf, nan, too large) are left out, and added unchanged to
+    `rejected` when it is given.
+    """
+    rows = []
+    for row in reader:
+        if len(row) >= 4:
+            raw = list(row)
+            try:
+                row[2] = float(row[2])
+            except:
+                row[2] = 0.0
+            try:
+                row[4] = int(row[4])
+            except:
+                # Older files have no Id column: ids are given out by the caller
+                row[4:] = [None]
+            try:
+                date_to_ordinal(row[0])
+                amount_to_cents(row[2])
+            except ValueError:
+                if rejected is not None:
+                    rejected.append(raw)
+                continue
+            rows.append(row[:5])
+    return rows
+
+def unreadable_filename(filename):
+    directory, name = os.path.split(filename)
+    return os.path.join(directory, "unreadable_" + name)
+
+def quarantine_rows(filename, rows):
+    """
+    Keep snapshot rows the store can't hold (unreadable dates or amounts) in
+    unreadable_<snapshot>.csv, so the next compaction doesn't lose them,
+    and tell the user. Rows already kept there are not added twice.
+    """
+    target = unreadable_filename(filename)
+    try:
+        with open(target, newline="") as f:
+            kept = {tuple(row) for row in csv.reader(f)}
+    except FileNotFoundError:
+        kept = set()
+    new = [row for row in rows if tuple(row) not in kept]
+    if not new:
+        return
+    try:
+        with open(target, "a", newline="") as f:
+            writer = csv.writer(f)
+            if not kept:
+                # A header, so the Import CSV dialog can map the columns
+                writer.writerow(["Date", "Category", "Amount", "Note", "Id"])
+            writer.writerows(new)
+    except OSError as e:
+        io_errors.put(f"{len(new)} expenses in {filename} have an unreadable date or amount and could not be set aside: {e}")
+        raise
+    io_errors.put(f"{len(new)} expenses in {filename} have an unreadable date or amount. "
+                  f"They were moved to {target}; fix them there and import them again.")
+
+def read_csv_snapshot(filename, quarantine=True):
+    """
+    Parse the snapshot CSV into a store, giving ids to rows without one.
+    Rows it can't hold are quarantined, or just left out if not `quarantine`.
+    """
+    with open(filename, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        rejected = []
+        rows = parse_snapshot_rows(reader, rejected)
+    if rejected and quarantine:
+        quarantine_rows(filename, rejected)
+
+    next_id = max((row[4] for row in rows if row[4] is not None), default=0) + 1
+    by_id = {}
+    for row in rows:
+        if row[4] is None:
+            row[4] = next_id
+            next_id += 1
+        by_id[row[4]] = row
+    return ExpenseStore(by_id[i] for i in sorted(by_id))
+
+@instrumented
+def load_expenses():
+    """
+    Load the current user's expenses from their storage backend.
+    Clears the global expenses list before loading.
+    Large ledgers are loaded progressively: the most recently entered
+    expenses (covering this month and last) come back at once and the
+    rest is read on a background thread and swapped in by adopt_history().
+    """
+    global expenses, history_loading, budgets
+    expenses = ExpenseStore()  # clear previous data to avoid mixing users
+    history_loading = False
+    history_changes.clear()
+    try:
+        budgets = BudgetIndex.load(budgets_filename(current_user))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        budgets = BudgetIndex()
+        messagebox.showerror("Budget Error", f"Could not read budgets: {e}")
+    try:
+        today = datetime.now()
+        since = month_bounds(today.year - (today.month == 1), (today.month - 2) % 12 + 1)[0]
+        recent = repository.load_recent(since) if PROGRESSIVE_LOAD else None
+        if recent is None:
+            expenses = repository.load()
+        else:
+            expenses = recent
+            history_loading = True
+            start_history_loader()
     except Exception as e:
-        messagebox.showerror("File Error", f"Could not load CSV: {e}")
+        messagebox.showerror("File Error", f"Could not load expenses: {e}")
+    attach_budgets(expenses)
+
+def record_change(op, rows, undo):
+    """
+    Persist a change already made to `expenses`; while history is loading,
+    also keep it for adopt_history(). If it can't be saved (e.g. the SQLite
+    database is locked by another writer), `undo()` takes it back out of
+    `expenses`, the user is told, and False is returned.
+    """
+    try:
+        repository.record_many(op, rows)
+    except (sqlite3.Error, OSError) as e:
+        undo()
+        update_table()
+        update_monthly_total()
+        messagebox.showerror("File Error", f"Could not save the change: {e}")
+        return False
+    if history_loading:
+        history_changes.extend((op, row) for row in rows)
+    return True
+
+def start_history_loader():
+    job = {"store": None, "error": None, "finished": False}
+
+    def run():
+        try:
+            job["store"] = repository.load_history()
+        except Exception as e:
+            job["error"] = e
+        job["finished"] = True
+
+    def poll():
+        if not job["finished"]:
+            root.after(HISTORY_POLL_MS, poll)
+        elif job["error"] is not None:
+            messagebox.showerror("File Error", f"Could not load older expenses: {job['error']}")
+        else:
+            adopt_history(job["store"])
+
+    threading.Thread(target=run, name="expense-history", daemon=True).start()
+    root.after(HISTORY_POLL_MS, poll)
+
+@instrumented
+def adopt_history(store):
+    """
+    Swap the fully loaded ledger in for the recent part. Changes made while
+    it was loading are applied on top first; the table keeps its place
+    (counted from the newest row) and a filter or date range is re-run.
+    """
+    global expenses, history_loading, table_offset
+    apply_changes(store, history_changes)
+    history_changes.clear()
+    recent = expenses
+    # Ids given to adds that were undone while loading aren't handed out again
+    store.next_id = max(store.next_id, recent.next_id)
+    expenses = store
+    repository.adopt(store)
+    attach_budgets(expenses)
+    history_loading = False
+    if table_rows is recent:
+        from_end = len(recent) - table_offset
+        update_table()
+        table_offset = max(0, len(expenses) - from_end)
+        sync_table()
+    elif isinstance(table_rows, ExpenseView) and table_rows.query is not None:
+        update_table(ExpenseView(expenses, table_rows.query(expenses), table_rows.query))
+    update_monthly_total()
+
+def history_pending(action):
+    """Tell the user `action` has to wait for the older expenses; True if it does."""
+    if history_loading:
+        messagebox.showinfo("Loading", f"Older expenses are still loading; {action} in a moment.")
+    return history_loading
 
+def row_values(row):
+    return (row[0], row[1], f"{row[2]:.2f}", row[3], "✏️  🗑️")
+
+@instrumented
 def update_table(filtered=None):
-    # Clear tree first
-    for row in tree.get_children():
-        tree.delete(row)
-    data = filtered if filtered else expenses
-    for row in data:
-        tree.insert("", tk.END, values=(row[0], row[1], f"{row[2]:.2f}", row[3], "✏️  🗑️"))
+    """
+    Show `filtered` (or all expenses) in the table.
+    Switching to a different result set scrolls back to the top; refreshing
+    the same set keeps the scroll position, so after a single add/edit/delete
+    only the affected Treeview item is touched.
+    """
+    global table_rows, table_offset
+    data = filtered if filtered is not None else expenses
+    if data is not table_rows:
+        table_rows = data
+        table_offset = 0
+    sync_table()
+
+def sync_table():
+    """
+    Diff the visible slice of table_rows against the materialized items and
+    apply only the inserts/updates/deletes needed to make them match.
+    """
+    global table_offset
+    table_offset = max(0, min(table_offset, len(table_rows) - table_visible))
+    wanted = [(str(row[4]), row_values(row)) for row in table_rows[table_offset:table_offset + table_visible]]
+    wanted_iids = [iid for iid, _ in wanted]
+    wanted_set = set(wanted_iids)
+
+    order = list(tree.get_children())
+    for iid in order:
+        if iid not in wanted_set:
+            tree.delete(iid)
+            table_shown.pop(iid, None)
+    kept = [iid for iid in order if iid in wanted_set]
+    in_order = kept == [iid for iid in wanted_iids if iid in table_shown]
+
+    for pos, (iid, values) in enumerate(wanted):
+        if iid not in table_shown:
+            tree.insert("", pos, iid=iid, values=values)
+        else:
+            if table_shown[iid] != values:
+                tree.item(iid, values=values)
+            if not in_order:
+                tree.move(iid, "", pos)
+        table_shown[iid] = values
+    update_scrollbar()
+
+def update_scrollbar():
+    total = len(table_rows)
+    if total <= table_visible:
+        vsb.set(0, 1)
+    else:
+        vsb.set(table_offset / total, (table_offset + table_visible) / total)
+
+def scroll_table(*args):
+    """Scrollbar command: move the materialized window over table_rows."""
+    global table_offset
+    if args[0] == "moveto":
+        table_offset = int(float(args[1]) * len(table_rows))
+    elif args[0] == "scroll":
+        step = table_visible if args[2] == "pages" else 1
+        table_offset += int(args[1]) * step
+    sync_table()
+
+def on_table_wheel(event):
+    if event.num == 4:
+        units = -3
+    elif event.num == 5:
+        units = 3
+    else:
+        units = -3 if event.delta > 0 else 3
+    scroll_table("scroll", units, "units")
+    return "break"
 
+def on_table_key(event, step):
+    # Arrow keys past the first/last materialized item scroll the window
+    selected = tree.selection()
+    children = tree.get_children()
+    if not selected or not children:
+        return
+    edge = children[0] if step < 0 else children[-1]
+    if selected[0] != edge:
+        return
+    before = table_offset
+    scroll_table("scroll", step, "units")
+    if table_offset != before:
+        children = tree.get_children()
+        target = children[0] if step < 0 else children[-1]
+        tree.selection_set(target)
+        tree.focus(target)
+    return "break"
+
+def on_table_resize(event):
+    global table_visible
+    children = tree.get_children()
+    bbox = tree.bbox(children[0]) if children else None
+    heading = bbox[1] if bbox else TABLE_ROW_HEIGHT
+    visible = max(1, (event.height - heading) // TABLE_ROW_HEIGHT)
+    if visible != table_visible:
+        table_visible = visible
+        sync_table()
+
+@instrumented
 def filter_expenses():
-    keyword = filter_entry.get().lower()
-    filtered = [row for row in expenses if keyword in row[1].lower() or keyword in row[3].lower()]
-    update_table(filtered)
+    keyword = filter_entry.get()
+    query = lambda store: repository.search(store, keyword)
+    update_table(ExpenseView(expenses, query(expenses), query))
+
+def schedule_live_search(event=None):
+    """
+    Search as you type: each keystroke restarts a short timer, so only the
+    query typed last is run and the ones it superseded are dropped.
+    """
+    global live_search_job
+    if live_search_job is not None:
+        root.after_cancel(live_search_job)
+    live_search_job = root.after(LIVE_SEARCH_DELAY_MS, run_live_search)
+
+def run_live_search():
+    global live_search_job
+    live_search_job = None
+    filter_expenses()
 
 def export_to_csv():
-    data = [tree.item(row)["values"] for row in tree.get_children()]
-    if not data:
+    if history_pending("export again"):
+        return
+    if not len(table_rows):
         messagebox.showwarning("No Data", "No data to export.")
         return
-    file = filedialog.asksaveasfilename(defaultextension=".csv")
-    if file:
-        try:
-            with open(file, "w", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(["Date", "Category", "Amount", "Note"])
-                writer.writerows([[r[0], r[1], r[2], r[3]] for r in data])
-            messagebox.showinfo("Exported", f"Data exported to {file}")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Could not export CSV: {e}")
+    filtered = isinstance(table_rows, ExpenseView)
+
+    win = tk.Toplevel(root)
+    win.title("Export CSV")
+    win.geometry("340x360")
+    scope = "the current filter result" if filtered else "all expenses"
+    tk.Label(win, text=f"Export {len(table_rows)} rows of {scope}").pack(pady=(10, 6))
+
+    range_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(win, text="Only dates in range", variable=range_var).pack()
+    range_frame = tk.Frame(win)
+    range_frame.pack(pady=4)
+    tkcalendar = heavy_import("tkcalendar")
+    tk.Label(range_frame, text="From").pack(side="left")
+    from_entry = tkcalendar.DateEntry(range_frame, width=10, date_pattern="mm/dd/yy")
+    from_entry.pack(side="left", padx=4)
+    tk.Label(range_frame, text="To").pack(side="left")
+    to_entry = tkcalendar.DateEntry(range_frame, width=10, date_pattern="mm/dd/yy")
+    to_entry.pack(side="left", padx=4)
+
+    tk.Label(win, text="Categories (none selected = all)").pack(pady=(6, 0))
+    category_list = tk.Listbox(win, selectmode="multiple", height=6, exportselection=False)
+    for category in sorted(expenses.rollup.categories):
+        category_list.insert("end", category)
+    category_list.pack(fill="x", padx=16)
+    gzip_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(win, text="Compress (gzip)", variable=gzip_var).pack(pady=4)
+    status = tk.Label(win, text="")
+    status.pack()
+
+    def start():
+        gzipped = gzip_var.get()
+        file = filedialog.asksaveasfilename(
+            parent=win, defaultextension=".csv.gz" if gzipped else ".csv",
+            filetypes=[("Gzipped CSV", "*.csv.gz")] if gzipped else [("CSV Files", "*.csv")])
+        if not file:
+            return
+        # Row selection happens on the model: the date range comes from the
+        # date index and the worker streams from a column copy of the store
+        if range_var.get():
+            start_day = from_entry.get_date().toordinal()
+            end_day = to_entry.get_date().toordinal()
+            ids = repository.between(expenses, min(start_day, end_day), max(start_day, end_day))
+            if filtered:
+                wanted = set(table_rows.ids)
+                ids = [x for x in ids if x in wanted]
+        else:
+            ids = list(table_rows.ids) if filtered else None
+        categories = {category_list.get(i) for i in category_list.curselection()} or None
+        store = expenses.snapshot()
+        job = {"done": 0, "error": None, "finished": False}
+        cancel = threading.Event()
+        export_button.config(text="Cancel", command=cancel.set)
+        win.protocol("WM_DELETE_WINDOW", cancel.set)
+
+        def run():
+            try:
+                write_csv_export(file, store, ids, categories, gzipped, job, cancel)
+            except Exception as e:
+                job["error"] = e
+            job["finished"] = True
+
+        def poll():
+            status.config(text=f"{job['done']} rows processed...")
+            if not job["finished"]:
+                win.after(100, poll)
+                return
+            win.destroy()
+            if job["error"] is not None:
+                messagebox.showerror("Export Error", f"Could not export CSV: {job['error']}")
+            elif cancel.is_set():
+                messagebox.showinfo("Export", "CSV export cancelled.")
+            else:
+                messagebox.showinfo("Exported", f"{job['done']} rows exported to {file}")
 
+        threading.Thread(target=run, name="expense-export", daemon=True).start()
+        poll()
+
+    export_button = tk.Button(win, text="Export", command=start, bg="#4D77FF", fg="white", width=12)
+    export_button.pack(pady=8)
+
+@instrumented
 def update_monthly_total():
     current_month = datetime.now().month
     current_year = datetime.now().year
-    total = 0.0
-    for row_id in tree.get_children():
-        values = tree.item(row_id)["values"]
-        try:
-            date = datetime.strptime(values[0], "%m/%d/%y")
-            if date.month == current_month and date.year == current_year:
-                total += float(values[2])
-        except:
-            pass
-    monthly_total_label.config(text=f"This Month's Total: ₹ {total:.2f}")
+    if table_rows is expenses:
+        total = repository.month_total(expenses, current_year, current_month)
+    else:
+        start, end = month_bounds(current_year, current_month)
+        total = 0.0
+        for row in table_rows:
+            if start <= date_to_ordinal(row[0]) < end:
+                total += float(row[2])
+    loading = " (loading older expenses...)" if history_loading else ""
+    monthly_total_label.config(text=f"This Month's Total: ₹ {total:.2f}{loading}")
+    update_budget_alerts()
+
+def update_budget_alerts():
+    """
+    Show this month's budget warnings next to the monthly total, plus any
+    limit the last change pushed another month across. Rings the bell
+    when a limit was just exceeded.
+    """
+    today = datetime.now()
+    month = (today.year, today.month)
+    crossed = budgets.check()
+    messages = [budget_text(rule, cents, level, m) for rule, m, cents, level in crossed if m != month]
+    current = budgets.status(month)
+    messages += [budget_text(rule, cents, level) for rule, cents, level in current]
+    if len(messages) > 2:
+        messages[2:] = [f"+{len(messages) - 2} more"]
+    over = any(level == BUDGET_OVER for *_, level in crossed + current)
+    budget_label.config(text="   ·   ".join(messages), fg="#FF6B6B" if over else "#FDCB6E")
+    if any(level == BUDGET_OVER for *_, level in crossed):
+        root.bell()
 
 def close_app():
-    save_to_csv()
+    repository.close()
+    stop_io_worker()
+    dump_metrics()
+    while not io_errors.empty():
+        messagebox.showerror("File Error", io_errors.get_nowait())
     root.destroy()
 
+# --------------------- Binary snapshot ---------------------
+
+# Alongside expenses_<user>.csv a binary copy (expenses_<user>.bin) is kept:
+# the store's columns as fixed-width arrays followed by a string table,
+# which loads with a few memcpy calls from an mmap instead of a CSV parse.
+# It records the size and mtime of the CSV it was made from and is ignored
+# (and rebuilt) as soon as the CSV no longer matches. EXPENSE_BINARY_SNAPSHOT=0
+# turns it off.
+BINARY_SNAPSHOTS = os.environ.get("EXPENSE_BINARY_SNAPSHOT", "1") != "0"
+BIN_MAGIC = b"EXPB"
+BIN_VERSION = 1
+# magic, version, csv size, csv mtime_ns, rows, categories, notes
+BIN_HEADER = struct.Struct("<4sIQqQII")
+
+def binary_filename(csv_name):
+    return os.path.splitext(csv_name)[0] + ".bin"
+
+def csv_stamp(csv_name):
+    st = os.stat(csv_name)
+    return st.st_size, st.st_mtime_ns
+
+def write_binary_snapshot(csv_name, store):
+    """Write the binary copy of `store` for the CSV just written to `csv_name`."""
+    filename = binary_filename(csv_name)
+    tmp_name = filename + ".tmp"
+    # Drop notes no row refers to any more, so edits don't grow the pool forever
+    used = sorted(set(store.notes))
+    note_pool = store.note_pool
+    notes = store.notes
+    if len(used) < len(note_pool):
+        remap = {code: new for new, code in enumerate(used)}
+        note_pool = [note_pool[code] for code in used]
+        notes = array("I", [remap[code] for code in notes])
+    strings = [s.encode("utf-8") for s in store.categories + note_pool]
+    size, mtime_ns = csv_stamp(csv_name)
+    with open(tmp_name, "wb") as f:
+        f.write(BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, size, mtime_ns, len(store),
+                                len(store.categories), len(note_pool)))
+        for column in (store.dates, store.cents, store.cats, notes, store.ids,
+                       array("I", [len(b) for b in strings])):
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(f)
+        f.write(b"".join(strings))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+def read_binary_snapshot(csv_name):
+    """
+    The store saved in the binary copy of `csv_name`, or None if there is
+    none, it no longer matches the CSV, or it isn't exactly as long as its
+    header says (e.g. cut short by a full disk). The CSV is read instead.
+    """
+    try:
+        stamp = csv_stamp(csv_name)
+        f = open(binary_filename(csv_name), "rb")
+    except OSError:
+        return None
+    try:
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            parts = parse_binary_snapshot(view, stamp)
+    except (ValueError, struct.error):   # empty file, bad UTF-8
+        return None
+    if parts is None:
+        return None
+    columns, categories, note_pool = parts
+    return ExpenseStore.from_columns(columns, categories, note_pool)
+
+def parse_binary_snapshot(view, stamp):
+    """
+    (columns, categories, note_pool) from the bytes of a binary copy made
+    of the CSV with the given stamp, or None if they don't add up.
+    """
+    if len(view) < BIN_HEADER.size:
+        return None
+    magic, version, size, mtime_ns, rows, n_categories, n_notes = BIN_HEADER.unpack_from(view)
+    if magic != BIN_MAGIC or version != BIN_VERSION or (size, mtime_ns) != stamp:
+        return None
+    layout = (("i", rows), ("q", rows), ("H", rows), ("I", rows), ("q", rows),
+              ("I", n_categories + n_notes))
+    offset = BIN_HEADER.size
+    end = offset + sum(array(typecode).itemsize * count for typecode, count in layout)
+    if end > len(view):
+        return None
+    columns = []
+    for typecode, count in layout:
+        column = array(typecode)
+        end = offset + column.itemsize * count
+        column.frombytes(view[offset:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    lengths = columns.pop()
+    if offset + sum(lengths) != len(view):
+        return None
+    strings = []
+    for length in lengths:
+        strings.append(str(view[offset:offset + length], "utf-8"))
+        offset += length
+    return columns, strings[:n_categories], strings[n_categories:]
+
+# --------------------- Storage backends ---------------------
+
+# EXPENSE_STORAGE selects where expenses are kept: "csv" (per-user CSV +
+# journal, the default) or "sqlite" (one database for all users).
+STORAGE_BACKEND = os.environ.get("EXPENSE_STORAGE", "csv")
+DB_FILENAME = "expenses.db"
+# Every SQLite connection of this process (the API server has one per user,
+# used from the event loop and worker threads) is used under this lock, so
+# they take turns instead of failing with "database is locked". Other
+# processes are waited for up to the busy timeout.
+sqlite_lock = threading.RLock()
+SQLITE_BUSY_TIMEOUT_MS = 30000
+
+# Ledgers at least this big are loaded progressively (see load_expenses)
+PROGRESSIVE_MIN_BYTES = 4 << 20
+PROGRESSIVE_MIN_ROWS = 100000
+PROGRESSIVE_RECENT_ROWS = 2000   # newest rows always in the recent part (SQLite)
+CSV_TAIL_BLOCK = 256 << 10
+
+def split_csv_records(data):
+    """
+    Split `data`, which ends where a CSV record ends, into (head, records).
+    A newline ends a record unless it is inside a quoted field, i.e. unless
+    an odd number of quote characters follows it in `data`. `head` is what
+    comes before the first newline that ends a record: the end of a record
+    that started earlier, or a whole record if `data` starts with one.
+    """
+    lines = data.split(b"\n")
+    records = []
+    record = []   # lines of the record being gathered, last first
+    quotes = 0
+    for line in reversed(lines[1:]):
+        record.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            records.append(b"\n".join(reversed(record)))
+            record, quotes = [], 0
+    record.append(lines[0])
+    records.reverse()
+    return b"\n".join(reversed(record)), records
+
+def read_csv_tail(filename, since):
+    """
+    Rows from the end of a snapshot CSV, read backwards a block at a time
+    until, once expenses dated from ordinal `since` on have been found, a
+    whole block holds none. Snapshot rows are in id order, i.e. the order
+    they were entered, so this is the newest part of the ledger. Ids don't
+    follow dates (backdated expenses, imported statements), so expenses
+    dated from `since` on are still missed when more than a block of older
+    ones separates them from the later ones.
+    Returns None for files without an Id column, whose ids are only known
+    after reading everything.
+    """
+    with open(filename, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8", "replace")]), [])
+        if header[4:5] != ["Id"]:
+            return None
+        body_start = f.tell()
+        pos = f.seek(0, os.SEEK_END)
+        rows = []
+        carry = b""
+        found = False   # read an expense dated from `since` on
+        while pos > body_start:
+            start = max(body_start, pos - CSV_TAIL_BLOCK)
+            f.seek(start)
+            # The first record of a block may have started in the one before
+            # it (notes can span lines); it is completed by the next block
+            carry, records = split_csv_records(f.read(pos - start) + carry)
+            pos = start
+            if pos == body_start:
+                records.insert(0, carry)
+            block = parse_snapshot_rows(csv.reader(record.decode("utf-8", "replace") + "\n" for record in records))
+            block = [row for row in block if row[4] is not None]
+            rows[:0] = block
+            recent = any(date_to_ordinal(row[0]) >= since for row in block)
+            if found and block and not recent:
+                break
+            found = found or recent
+    return rows
+
+class ExpenseRepository:
+    """
+    Where one user's expenses are kept. The app loads, records changes and
+    asks its filter/date/total questions through this interface; by default
+    the questions are answered from the in-memory store's indexes.
+    """
+
+    def load(self, read_only=False):
+        """
+        Return the user's expenses as an ExpenseStore. With `read_only`
+        (reports run next to the app) nothing is written: no caches,
+        repairs or migration, and the repository isn't set up to record
+        changes to the store.
+        """
+        raise NotImplementedError
+
+    def load_recent(self, since):
+        """
+        For progressive loading: a store with the most recently entered
+        expenses, the highest ids and (as far as the backend can tell without
+        reading everything) the ones dated from ordinal `since` on, or None
+        to load everything at once with load().
+        The rest then comes from load_history() and adopt().
+        """
+        return None
+
+    def load_history(self):
+        """The whole ledger, after load_recent(). Runs on a worker thread."""
+        raise NotImplementedError
+
+    def adopt(self, store):
+        """`store` (from load_history) is now the app's ledger."""
+
+    def record(self, op, row):
+        """Persist one "add", "edit" or "delete" of `row`."""
+        self.record_many(op, [row])
+
+    def record_many(self, op, rows):
+        """Persist the same change to many rows as one batch."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def search(self, store, keyword):
+        return store.search.search(store, keyword)
+
+    def between(self, store, start, end):
+        return store.by_date.between(start, end)
+
+    def month_total(self, store, year, month):
+        return store.rollup.month_total(year, month)
+
+    def spending_days(self, store, start, end):
+        return [ordinal for ordinal in range(start, end + 1) if ordinal in store.rollup.days]
+
+class CsvRepository(ExpenseRepository):
+    """
+    expenses_<user>.csv snapshot (plus its binary copy) and an append-only
+    expenses_<user>.journal of changes, written by the background I/O thread.
+    """
+
+    def __init__(self, username):
+        self.csv_name = user_csv_filename(username)
+        self.journal_name = os.path.splitext(self.csv_name)[0] + ".journal"
+        self.journal_records = 0   # changes journaled since the last compaction
+        self.store = None
+        self.partial = False       # self.store only holds the recent part
+        self.journal = None        # journal changes read by load_recent()
+
+    def read_snapshot(self, read_only=False):
+        store = read_binary_snapshot(self.csv_name) if BINARY_SNAPSHOTS else None
+        if store is None:
+            try:
+                store = read_csv_snapshot(self.csv_name, quarantine=not read_only)
+            except FileNotFoundError:
+                # No file yet: that's fine — user has empty list
+                store = ExpenseStore()
+            if BINARY_SNAPSHOTS and not read_only and os.path.exists(self.csv_name):
+                try:
+                    write_binary_snapshot(self.csv_name, store)
+                except OSError:
+                    pass
+        return store
+
+    @instrumented
+    def load(self, read_only=False):
+        store = self.read_snapshot(read_only)
+        if read_only:
+            apply_changes(store, read_journal(self.journal_name, repair=False))
+            return store
+        self.journal_records = replay_journal(self.journal_name, store)
+        self.store = store
+        return store
+
+    @instrumented
+    def load_recent(self, since):
+        try:
+            if os.path.getsize(self.csv_name) < PROGRESSIVE_MIN_BYTES:
+                return None
+        except FileNotFoundError:
+            return None
+        rows = read_csv_tail(self.csv_name, since)
+        if rows is None:
+            return None
+        by_id = {row[4]: row for row in rows}
+        store = ExpenseStore(by_id[x] for x in sorted(by_id))
+        # The journal is read (and a torn tail cut off) here, before the I/O
+        # thread starts appending to it
+        self.journal = read_journal(self.journal_name)
+        apply_changes(store, self.journal)
+        self.journal_records = journal_changes(self.journal)
+        self.store = store
+        self.partial = True
+        return store
+
+    @instrumented
+    def load_history(self):
+        store = self.read_snapshot()
+        apply_changes(store, self.journal)
+        return store
+
+    def adopt(self, store):
+        self.store = store
+        self.partial = False
+        self.journal = None
+
+    @instrumented
+    def record_many(self, op, rows):
+        """
+        Append add/edit/delete records to the journal.
+        Only the changed rows are written; the full CSV is rewritten by
+        compact() once the journal has grown large enough. A batch of new
+        rows that reaches that size goes straight into the snapshot write:
+        no older journal record can name their fresh ids.
+        """
+        self.journal_records += len(rows)
+        # A snapshot of a partly loaded ledger would drop the older history
+        compacting = not self.partial and self.journal_records >= max(JOURNAL_COMPACT_MIN, len(self.store))
+        if compacting and op == "add":
+            self.compact()
+            return
+        lines = []
+        for row in rows:
+            entry = {"op": op, "id": row[4]}
+            if op != "delete":
+                entry["row"] = row[:4]
+            lines.append(json.dumps(entry) + "\n")
+        # Journaled before the snapshot, so a crash before the journal is
+        # truncated replays this change too instead of an older one
+        submit_io(("journal", self.journal_name, "".join(lines)))
+        if compacting:
+            self.compact()
+
+    @instrumented
+    def compact(self):
+        """
+        Fold the journal into the snapshot CSV and start a fresh journal.
+        Replaying is idempotent (records are keyed by id), so a crash between
+        the snapshot rename and the journal truncation loses nothing.
+        """
+        submit_io(("snapshot", self.csv_name, self.journal_name, self.store.snapshot()))
+        self.journal_records = 0
+
+    def close(self):
+        # Nothing to fold in when the journal holds no changes
+        if self.store is not None and not self.partial and self.journal_records:
+            self.compact()
+
+class SqliteRepository(ExpenseRepository):
+    """
+    All users in one SQLite database (WAL mode), indexed on (user, date) and
+    (user, category). Filters, date lookups and totals run as SQL queries.
+    Dates are stored as day ordinals and amounts as integer cents, like
+    the in-memory store. Writes commit on the calling thread; with WAL and
+    synchronous=NORMAL a commit doesn't wait for an fsync.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS expenses (
+            key INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            cents INTEGER NOT NULL,
+            note TEXT NOT NULL,
+            UNIQUE (user, id)
+        );
+        CREATE INDEX IF NOT EXISTS expenses_user_date ON expenses (user, date);
+        CREATE INDEX IF NOT EXISTS expenses_user_category ON expenses (user, category);
+        CREATE TABLE IF NOT EXISTS migrated_users (user TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS expense_ids (user TEXT PRIMARY KEY, next_id INTEGER NOT NULL);
+    """
+    # Keeps each user's id high-water mark (see ExpenseStore.next_id)
+    RAISE_NEXT_ID = ("INSERT INTO expense_ids (user, next_id) VALUES (?, ?) "
+                     "ON CONFLICT (user) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)")
+    # Substring search index; needs FTS5 with the trigram tokenizer (SQLite 3.34+)
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+            category, note, content='expenses', content_rowid='key', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, category, note) VALUES (new.key, new.category, new.note);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, category, note)
+            VALUES ('delete', old.key, old.category, old.note);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, category, note)
+            VALUES ('delete', old.key, old.category, old.note);
+            INSERT INTO expenses_fts (rowid, category, note) VALUES (new.key, new.category, new.note);
+        END;
+    """
+
+    def __init__(self, username, path=DB_FILENAME):
+        self.user = username or ""
+        self.path = path
+        self.partial = False   # the app's store only holds the recent part
+        with sqlite_lock:
+            # Used from worker threads too, always under sqlite_lock
+            self.conn = self.connect(check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+            try:
+                self.conn.executescript(self.FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    def connect(self, **kwargs):
+        conn = sqlite3.connect(self.path, **kwargs)
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextlib.contextmanager
+    def writing(self):
+        """
+        A write transaction on self.conn. BEGIN IMMEDIATE takes the write
+        lock up front (waiting up to the busy timeout), so the transaction
+        never has to upgrade a read lock: SQLite fails such an upgrade at
+        once if another connection wrote in between.
+        """
+        with sqlite_lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            yield self.conn
+
+    def migrated(self):
+        with sqlite_lock:
+            return self.conn.execute("SELECT 1 FROM migrated_users WHERE user = ?", (self.user,)).fetchone() is not None
+
+    def migrate(self):
+        with sqlite_lock:
+            if not self.migrated():
+                self.import_csv(CsvRepository(self.user or None).load())
+
+    @instrumented
+    def load(self, read_only=False):
+        with sqlite_lock:
+            if read_only and not self.migrated():
+                return CsvRepository(self.user or None).load(read_only=True)
+            self.migrate()
+            return self.read_store(self.conn)
+
+    @instrumented
+    def load_recent(self, since):
+        with sqlite_lock:
+            self.migrate()
+            count, top = self.conn.execute(
+                "SELECT COUNT(*), MAX(id) FROM expenses WHERE user = ?", (self.user,)).fetchone()
+            if count < PROGRESSIVE_MIN_ROWS:
+                return None
+            self.partial = True
+            return self.read_store(self.conn, "AND (date >= ? OR id > ?)", (since, top - PROGRESSIVE_RECENT_ROWS))
+
+    @instrumented
+    def load_history(self):
+        # sqlite3 connections stay on the thread that made them. Reading in
+        # WAL mode doesn't block the app's writes, so no sqlite_lock here.
+        conn = self.connect()
+        try:
+            return self.read_store(conn)
+        finally:
+            conn.close()
+
+    def adopt(self, store):
+        self.partial = False
+
+    def read_store(self, conn, where="", params=()):
+        pools = ExpenseStore()   # only used to intern categories and notes
+        columns = [array(t) for t in ("i", "q", "H", "I", "q")]
+        dates, cents, cats, notes, ids = columns
+        cursor = conn.execute(
+            f"SELECT date, cents, category, note, id FROM expenses WHERE user = ? {where} ORDER BY id",
+            (self.user,) + tuple(params))
+        for date, amount, category, note, expense_id in cursor:
+            dates.append(date)
+            cents.append(amount)
+            cats.append(pools.category_code(category))
+            notes.append(pools.note_code(note))
+            ids.append(expense_id)
+        store = ExpenseStore.from_columns(columns, pools.categories, pools.note_pool)
+        mark = conn.execute("SELECT next_id FROM expense_ids WHERE user = ?", (self.user,)).fetchone()
+        if mark:
+            store.next_id = max(store.next_id, mark[0])
+        return store
+
+    def import_csv(self, store):
+        """One-shot copy of the user's CSV ledger into the database."""
+        store.compact()
+        with self.writing():
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO expenses (user, id, date, category, cents, note) VALUES (?, ?, ?, ?, ?, ?)",
+                ((self.user, store.ids[i], store.dates[i], store.categories[store.cats[i]],
+                  store.cents[i], store.note_pool[store.notes[i]]) for i in range(len(store))))
+            self.conn.execute(self.RAISE_NEXT_ID, (self.user, store.next_id))
+            self.conn.execute("INSERT OR IGNORE INTO migrated_users (user) VALUES (?)", (self.user,))
+
+    @instrumented
+    def record_many(self, op, rows):
+        with self.writing():
+            if op == "delete":
+                self.conn.executemany("DELETE FROM expenses WHERE user = ? AND id = ?",
+                                      ((self.user, row[4]) for row in rows))
+            else:
+                self.conn.executemany(
+                    "INSERT INTO expenses (user, id, date, category, cents, note) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user, id) DO UPDATE SET date = excluded.date, "
+                    "category = excluded.category, cents = excluded.cents, note = excluded.note",
+                    ((self.user, row[4], date_to_ordinal(row[0]), row[1], amount_to_cents(row[2]), row[3])
+                     for row in rows))
+            if rows:
+                # Deletes too: databases from before expense_ids have no mark yet
+                self.conn.execute(self.RAISE_NEXT_ID, (self.user, max(row[4] for row in rows) + 1))
+
+    def close(self):
+        with sqlite_lock:
+            self.conn.close()
+
+    def query(self, sql, params):
+        with sqlite_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def search(self, store, keyword):
+        # Until the history is adopted, only ids in the partial store can be shown
+        if self.partial:
+            return super().search(store, keyword)
+        if self.fts and len(keyword) >= 3:
+            found = self.query(
+                "SELECT e.id FROM expenses_fts f JOIN expenses e ON e.key = f.rowid "
+                "WHERE expenses_fts MATCH ? AND e.user = ? ORDER BY e.id",
+                ('"' + keyword.replace('"', '""') + '"', self.user))
+        else:
+            keyword = keyword.lower()
+            found = self.query(
+                "SELECT id FROM expenses WHERE user = ? AND "
+                "(instr(lower(category), ?) > 0 OR instr(lower(note), ?) > 0) ORDER BY id",
+                (self.user, keyword, keyword))
+        return [expense_id for (expense_id,) in found]
+
+    def between(self, store, start, end):
+        if self.partial:
+            return super().between(store, start, end)
+        found = self.query(
+            "SELECT id FROM expenses WHERE user = ? AND date BETWEEN ? AND ? ORDER BY date, id",
+            (self.user, start, end))
+        return [expense_id for (expense_id,) in found]
+
+    def month_total(self, store, year, month):
+        start, end = month_bounds(year, month)
+        [(cents,)] = self.query(
+            "SELECT COALESCE(SUM(cents), 0) FROM expenses WHERE user = ? AND date >= ? AND date < ?",
+            (self.user, start, end))
+        return cents / 100
+
+    def spending_days(self, store, start, end):
+        found = self.query(
+            "SELECT DISTINCT date FROM expenses WHERE user = ? AND date BETWEEN ? AND ?",
+            (self.user, start, end))
+        return [ordinal for (ordinal,) in found]
+
+def open_repository(username):
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteRepository(username)
+    return CsvRepository(username)
+
+def ledger_users():
+    """Usernames that have an expenses_<user>.csv in the working directory."""
+    return [name[len("expenses_"):-len(".csv")] for name in sorted(os.listdir("."))
+            if name.startswith("expenses_") and name.endswith(".csv")]
+
+def migrate_csv_to_sqlite(path=DB_FILENAME):
+    """
+    Copy every expenses_<user>.csv (with its journal) into the SQLite
+    database. Users already migrated are skipped. Returns the users copied.
+    """
+    copied = []
+    for username in ledger_users():
+        repo = SqliteRepository(username, path)
+        try:
+            if not repo.migrated():
+                repo.import_csv(CsvRepository(username).load())
+                copied.append(username)
+        finally:
+            repo.close()
+    return copied
+
+# --------------------- Background persistence ---------------------
+
+@instrumented
+def run_io_batch(tasks):
+    """
+    Carry out a batch of queued writes with as little I/O as possible:
+    journal lines are appended with one write per file, and of several
+    snapshots of the same file only the last is written. Lines queued
+    before a snapshot are already part of it, but are still appended
+    before it is written: if the app dies between replacing the CSV and
+    truncating the journal, replaying the journal then ends on the same
+    rows as the snapshot instead of an older version of them.
+    """
+    lines = {}       # journal filename -> queued lines
+    cut = {}         # journal filename -> lines covered by the last snapshot
+    snapshots = {}   # journal filename -> (csv filename, rows)
+    for task in tasks:
+        if task[0] == "journal":
+            lines.setdefault(task[1], []).append(task[2])
+        else:
+            _, csv_name, journal_name, rows = task
+            snapshots[journal_name] = (csv_name, rows)
+            cut[journal_name] = len(lines.get(journal_name, ()))
+
+    errors = []
+    for journal_name, (csv_name, rows) in snapshots.items():
+        covered = lines.get(journal_name, [])[:cut[journal_name]]
+        lines[journal_name] = lines.get(journal_name, [])[cut[journal_name]:]
+        if covered:
+            try:
+                write_journal(journal_name, covered)
+            except Exception as e:
+                errors.append(f"Could not save change: {e}")
+        try:
+            write_snapshot(csv_name, rows)
+            reset_journal(journal_name, rows.next_id)
+        except Exception as e:
+            errors.append(f"Could not save CSV: {e}")
+    for journal_name, queued in lines.items():
+        if queued:
+            try:
+                write_journal(journal_name, queued)
+            except Exception as e:
+                errors.append(f"Could not save change: {e}")
+    return errors
+
+def io_worker_loop():
+    while True:
+        batch = [io_queue.get()]
+        # Gather whatever else arrives within the window into the same batch
+        deadline = time.monotonic() + SAVE_COALESCE_MS / 1000
+        while batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(io_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        tasks = [task for task in batch if task is not None]
+        try:
+            for message in run_io_batch(tasks):
+                io_errors.put(message)
+        except Exception as e:
+            io_errors.put(f"Could not save changes: {e}")
+        if stop:
+            return
+
+def start_io_worker():
+    global io_thread
+    io_thread = threading.Thread(target=io_worker_loop, name="expense-io", daemon=True)
+    io_thread.start()
+
+def stop_io_worker():
+    """Flush everything queued so far and wait for the worker to finish."""
+    global io_thread
+    if io_thread is not None:
+        io_queue.put(None)
+        io_thread.join()
+        io_thread = None
+
+def submit_io(task):
+    if io_thread is not None:
+        io_queue.put(task)
+        return
+    # No worker (headless callers, or before the main window exists): write
+    # right away and let the caller handle a failure
+    errors = run_io_batch([task])
+    if errors:
+        raise OSError("; ".join(errors))
+
+def poll_io_errors():
+    """Show errors reported by the worker; re-arms itself on the Tk loop."""
+    while True:
+        try:
+            message = io_errors.get_nowait()
+        except queue.Empty:
+            break
+        messagebox.showerror("File Error", message)
+    root.after(IO_ERROR_POLL_MS, poll_io_errors)
+
 # --------------------- New features ---------------------
 
 def export_to_pdf():
-    data = [tree.item(row)["values"] for row in tree.get_children()]
-    if not data:
+    if history_pending("export again"):
+        return
+    if not table_rows:
         messagebox.showwarning("No Data", "No data to include in PDF.")
         return
     file = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
     if not file:
         return
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "Expense Report", ln=True, align="C")
-    pdf.ln(4)
-    pdf.set_font("Arial", size=10)
-    # Table header
-    pdf.cell(40, 8, "Date", 1, 0, "C")
-    pdf.cell(40, 8, "Category", 1, 0, "C")
-    pdf.cell(40, 8, "Amount", 1, 0, "C")
-    pdf.cell(70, 8, "Note", 1, 1, "C")
-    for r in data:
-        pdf.cell(40, 8, str(r[0]), 1, 0, "C")
-        pdf.cell(40, 8, str(r[1]), 1, 0, "C")
-        pdf.cell(40, 8, str(r[2]), 1, 0, "R")
-        note_text = str(r[3])[:38]
-        pdf.cell(70, 8, note_text, 1, 1, "L")
+    grouped = messagebox.askyesno("PDF Report", "Group the report by month with subtotals?")
+
+    # The worker reads a column copy of the store, so the ledger can keep
+    # changing while the report is generated.
+    store = expenses.snapshot()
+    if isinstance(table_rows, ExpenseView):
+        ids = list(table_rows.ids)
+        totals = None
+    else:
+        ids = expenses.by_date.ordered_ids() if grouped else array("q", store.ids)
+        # Plain numbers: the rollup's [cents, count] lists keep changing on this thread
+        totals = ({month: cents for month, (cents, _) in expenses.rollup.months.items()},
+                  expenses.rollup.category_totals())
+    job = {"done": 0, "total": len(ids), "error": None, "finished": False}
+    cancel = threading.Event()
+
+    win = tk.Toplevel(root)
+    win.title("PDF Report")
+    win.geometry("320x120")
+    tk.Label(win, text=f"Generating report for {len(ids)} expenses...").pack(pady=(12, 6))
+    bar = ttk.Progressbar(win, length=260, maximum=max(1, len(ids)))
+    bar.pack(pady=4)
+    tk.Button(win, text="Cancel", command=cancel.set, bg="#636E72", fg="white").pack(pady=6)
+    win.protocol("WM_DELETE_WINDOW", cancel.set)
+
+    def run():
+        try:
+            write_pdf_report(file, store, ids, grouped, totals, job, cancel)
+        except Exception as e:
+            job["error"] = e
+        job["finished"] = True
+
+    def poll():
+        bar["value"] = job["done"]
+        if not job["finished"]:
+            win.after(100, poll)
+            return
+        win.destroy()
+        if job["error"] is not None:
+            messagebox.showerror("PDF Error", f"Could not save PDF: {job['error']}")
+        elif cancel.is_set():
+            messagebox.showinfo("PDF Report", "PDF export cancelled.")
+        else:
+            messagebox.showinfo("PDF Generated", f"PDF saved to {file}")
+
+    threading.Thread(target=run, name="expense-pdf", daemon=True).start()
+    poll()
+
+def import_from_csv():
+    # Duplicates are checked against the whole ledger
+    if history_pending("import again"):
+        return
+    file = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")])
+    if not file:
+        return
     try:
-        pdf.output(file)
-        messagebox.showinfo("PDF Generated", f"PDF saved to {file}")
-    except Exception as e:
-        messagebox.showerror("PDF Error", f"Could not save PDF: {e}")
+        header, sample = read_import_header(file)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        messagebox.showerror("Import Error", f"Could not read {file}: {e}")
+        return
+    if not header:
+        messagebox.showwarning("No Data", "The file is empty.")
+        return
+
+    win = tk.Toplevel(root)
+    win.title("Import CSV")
+    win.geometry("380x300")
+    tk.Label(win, text="Match the file's columns:").grid(row=0, column=0, columnspan=2, pady=(10, 6))
+    choices = ["(none)"] + [f"{i + 1}: {name}" for i, name in enumerate(header)]
+    guessed = guess_import_mapping(header)
+    pickers = {}
+    for r, field in enumerate(IMPORT_FIELDS, start=1):
+        tk.Label(win, text=field).grid(row=r, column=0, sticky="e", padx=8, pady=4)
+        picker = ttk.Combobox(win, values=choices, state="readonly", width=28)
+        column = guessed.get(field)
+        picker.set(choices[column + 1] if column is not None else choices[0])
+        picker.grid(row=r, column=1, padx=8, pady=4)
+        pickers[field] = picker
+    tk.Label(win, text="Date format").grid(row=5, column=0, sticky="e", padx=8, pady=4)
+    date_format = ttk.Combobox(win, values=IMPORT_DATE_FORMATS, width=28)
+    date_column = guessed.get("Date")
+    date_format.set(guess_date_format([row[date_column] for row in sample if date_column < len(row)])
+                    if date_column is not None else DATE_FORMAT)
+    date_format.grid(row=5, column=1, padx=8, pady=4)
+    status = tk.Label(win, text="")
+    status.grid(row=7, column=0, columnspan=2)
+
+    def start():
+        mapping = {field: choices.index(picker.get()) - 1 for field, picker in pickers.items()}
+        mapping = {field: column for field, column in mapping.items() if column >= 0}
+        if "Date" not in mapping or "Amount" not in mapping:
+            messagebox.showerror("Import", "Pick the Date and Amount columns.", parent=win)
+            return
+        fmt = date_format.get()
+        import_button.config(state="disabled")
+        job = {"done": 0, "error": None, "result": None, "finished": False}
+        cancel = threading.Event()
+        win.protocol("WM_DELETE_WINDOW", cancel.set)
+        # Dedupe against a column copy, so the worker never reads a store
+        # that is changing under it
+        store = expenses.snapshot()
+
+        def run():
+            try:
+                job["result"] = read_import_rows(file, mapping, fmt, store, job, cancel)
+            except Exception as e:
+                job["error"] = e
+            job["finished"] = True
+
+        def poll():
+            status.config(text=f"{job['done']} rows read...")
+            if not job["finished"]:
+                win.after(100, poll)
+                return
+            win.destroy()
+            if job["error"] is not None:
+                messagebox.showerror("Import Error", f"Could not import {file}: {job['error']}")
+            elif cancel.is_set():
+                messagebox.showinfo("Import", "Import cancelled.")
+            else:
+                rows, invalid, duplicates, credits = job["result"]
+                for n, row in enumerate(rows):
+                    row.append(expenses.next_id + n)
+                expenses.extend(rows)
+
+                def undo():
+                    for row in rows:
+                        expenses.delete(row[4])
+                if not record_change("add", rows, undo):
+                    return
+                update_table()
+                update_monthly_total()
+                messagebox.showinfo("Imported", f"Imported {len(rows)} expenses.\n"
+                                    f"Skipped {duplicates} duplicates, {credits} credits/refunds "
+                                    f"and {invalid} unreadable rows.")
+
+        threading.Thread(target=run, name="expense-import", daemon=True).start()
+        poll()
+
+    import_button = tk.Button(win, text="Import", command=start, bg="#2ECC71", fg="white", width=12)
+    import_button.grid(row=6, column=0, columnspan=2, pady=10)
+
+def show_diagnostics(event=None):
+    """Latency of the instrumented handlers, refreshed while the window is open."""
+    win = tk.Toplevel(root)
+    win.title("Diagnostics")
+    win.geometry("760x420")
+    text = tk.Text(win, font=("Courier", 9), bg="#1E1F29", fg="#ECEFF4", wrap="none")
+    text.pack(fill="both", expand=True, padx=8, pady=8)
+    header = " ".join(f"{'<' + format(b, 'g') if b != float('inf') else 'more':>5}" for b in LATENCY_BUCKETS_MS)
+
+    def refresh():
+        if not win.winfo_exists():
+            return
+        lines = [f"{'handler':<30}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}",
+                 f"{'':<30}recent-call histogram (ms): {header}"]
+        for name, summary in metrics_report().items():
+            lines.append(f"{name:<30}{summary['calls']:>7}{summary['p50_ms']:>9.1f}"
+                         f"{summary['p95_ms']:>9.1f}{summary['max_ms']:>9.1f}")
+            lines.append(f"{'':<58}" + " ".join(f"{n:>5}" for n in summary["histogram"].values()))
+        text.config(state="normal")
+        text.delete("1.0", "end")
+        text.insert("end", "\n".join(lines))
+        text.config(state="disabled")
+        win.after(1000, refresh)
+
+    refresh()
+
+def show_budgets():
+    win = tk.Toplevel(root)
+    win.title("Budgets")
+    win.geometry("420x360")
+    tk.Label(win, text="Monthly limits").pack(pady=(10, 4))
+    rule_list = tk.Listbox(win, height=8)
+    rule_list.pack(fill="x", padx=12)
+
+    def describe(rule):
+        return (f"{rule['category'] or 'All spending'}: ₹ {rule['limit'] / 100:.2f} a month"
+                f" (warn at {rule['warn_at']:.0%})")
+
+    def refresh():
+        rule_list.delete(0, "end")
+        for rule in budgets.rules:
+            rule_list.insert("end", describe(rule))
+
+    def save():
+        try:
+            budgets.save(budgets_filename(current_user))
+        except OSError as e:
+            messagebox.showerror("Budget Error", f"Could not save budgets: {e}", parent=win)
+        attach_budgets(expenses)
+        refresh()
+        update_monthly_total()
+
+    form = tk.Frame(win)
+    form.pack(pady=8)
+    all_spending = "All spending"
+    tk.Label(form, text="Category").grid(row=0, column=0, sticky="e", padx=4, pady=3)
+    category = ttk.Combobox(form, values=[all_spending] + sorted(set(CATEGORIES) | set(expenses.rollup.categories)),
+                            state="readonly", width=20)
+    category.set(all_spending)
+    category.grid(row=0, column=1, pady=3)
+    tk.Label(form, text="Limit ₹ / month").grid(row=1, column=0, sticky="e", padx=4, pady=3)
+    limit_entry = tk.Entry(form, width=22)
+    limit_entry.grid(row=1, column=1, pady=3)
+    tk.Label(form, text="Warn at %").grid(row=2, column=0, sticky="e", padx=4, pady=3)
+    warn_entry = tk.Entry(form, width=22)
+    warn_entry.insert(0, f"{BUDGET_WARN_AT * 100:.0f}")
+    warn_entry.grid(row=2, column=1, pady=3)
+
+    def add_rule():
+        try:
+            limit = amount_to_cents(limit_entry.get())
+            warn_at = float(warn_entry.get()) / 100
+            if limit <= 0 or not 0 < warn_at <= 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Enter a positive limit and a warning level from 1 to 100.", parent=win)
+            return
+        chosen = category.get()
+        budgets.rules.append({"category": None if chosen == all_spending else chosen,
+                              "limit": limit, "warn_at": warn_at})
+        limit_entry.delete(0, tk.END)
+        save()
+
+    def remove_rule():
+        for i in reversed(rule_list.curselection()):
+            del budgets.rules[i]
+        save()
+
+    buttons = tk.Frame(win)
+    buttons.pack(pady=4)
+    tk.Button(buttons, text="Add Limit", command=add_rule, bg="#2ECC71", fg="white").pack(side="left", padx=6)
+    tk.Button(buttons, text="Remove Selected", command=remove_rule, bg="#b33939", fg="white").pack(side="left", padx=6)
+    tk.Button(win, text="Close", command=win.destroy, bg="#636E72", fg="white").pack(pady=6)
+    refresh()
 
 def show_calendar_view():
     cal_win = tk.Toplevel(root)
     cal_win.title("Monthly Calendar View")
-    cal_win.geometry("400x400")
-    cal = Calendar(cal_win, selectmode="day", date_pattern="mm/dd/yy")
+    cal_win.geometry("440x480")
+    tkcalendar = heavy_import("tkcalendar")
+    cal = tkcalendar.Calendar(cal_win, selectmode="day", date_pattern="mm/dd/yy")
     cal.pack(fill="both", expand=True, padx=10, pady=10)
+    cal.tag_config("spending", background="#6C5CE7", foreground="white")
+
+    def mark_spending_days(event=None):
+        # Only the displayed month is marked
+        cal.calevent_remove(tag="spending")
+        month, year = cal.get_displayed_month()
+        start, end = month_bounds(year, month)
+        for ordinal in repository.spending_days(expenses, start, end - 1):
+            cal.calevent_create(datetime.fromordinal(ordinal).date(), "Spending", "spending")
+
+    def show_range(start, end):
+        query = lambda store: repository.between(store, start, end)
+        update_table(ExpenseView(expenses, query(expenses), query))
+        cal_win.destroy()
 
     def on_date_select():
-        sel = cal.get_date()
-        filtered = [row for row in expenses if row[0] == sel]
-        update_table(filtered)
-        cal_win.destroy()
+        day = cal.selection_get()
+        if day:
+            show_range(day.toordinal(), day.toordinal())
+
+    def on_week_select():
+        day = cal.selection_get()
+        if day:
+            start = day.toordinal() - day.weekday()
+            show_range(start, start + 6)
+
+    def on_month_select():
+        month, year = cal.get_displayed_month()
+        start, end = month_bounds(year, month)
+        show_range(start, end - 1)
+
+    def on_range_select():
+        start = from_entry.get_date().toordinal()
+        end = to_entry.get_date().toordinal()
+        show_range(min(start, end), max(start, end))
+
+    cal.bind("<<CalendarMonthChanged>>", mark_spending_days)
+    mark_spending_days()
 
     btn_frame = tk.Frame(cal_win)
-    btn_frame.pack(pady=8)
+    btn_frame.pack(pady=4)
     tk.Button(btn_frame, text="Filter by Date", command=on_date_select, bg="#6C5CE7", fg="white").pack(side="left", padx=6)
-    tk.Button(btn_frame, text="Close", command=cal_win.destroy, bg="#636E72", fg="white").pack(side="left", padx=6)
-
+    tk.Button(btn_frame, text="Week", command=on_week_select, bg="#6C5CE7", fg="white").pack(side="left", padx=6)
+    tk.Button(btn_frame, text="Month", command=on_month_select, bg="#6C5CE7", fg="white").pack(side="left", padx=6)
+
+    range_frame = tk.Frame(cal_win)
+    range_frame.pack(pady=4)
+    tk.Label(range_frame, text="From").pack(side="left")
+    from_entry = tkcalendar.DateEntry(range_frame, width=10, date_pattern="mm/dd/yy")
+    from_entry.pack(side="left", padx=4)
+    tk.Label(range_frame, text="To").pack(side="left")
+    to_entry = tkcalendar.DateEntry(range_frame, width=10, date_pattern="mm/dd/yy")
+    to_entry.pack(side="left", padx=4)
+    tk.Button(range_frame, text="Filter Range", command=on_range_select, bg="#6C5CE7", fg="white").pack(side="left", padx=6)
+
+    tk.Button(cal_win, text="Close", command=cal_win.destroy, bg="#636E72", fg="white").pack(pady=6)
+
+@instrumented
 def show_analytics():
     if not expenses:
         messagebox.showwarning("No Data", "No expenses to analyze.")
         return
-
-    from collections import defaultdict
-    cat_sum = defaultdict(float)
-    month_sum = defaultdict(float)
-    for r in expenses:
-        try:
-            amt = float(r[2])
-        except:
-            amt = 0.0
-        cat_sum[r[1]] += amt
-        dt = datetime.strptime(r[0], "%m/%d/%y")
-        month_label = dt.strftime("%b %Y")
-        month_sum[month_label] += amt
-
-    months_sorted = sorted(month_sum.items(), key=lambda x: datetime.strptime(x[0], "%b %Y"))
-    m_labels = [m for m, _ in months_sorted]
-    m_values = [v for _, v in months_sorted]
+    if history_loading:
+        messagebox.showinfo("Analytics", "Older expenses are still loading; "
+                            "the charts cover recent expenses only until they are in.")
 
     analytic_win = tk.Toplevel(root)
     analytic_win.title("Analytics")
     analytic_win.geometry("900x450")
 
-    fig1 = plt.Figure(figsize=(4.5, 4), dpi=80)
-    ax1 = fig1.add_subplot(111)
-    cats = list(cat_sum.keys())
-    vals = [cat_sum[c] for c in cats]
-    if sum(vals) == 0:
-        vals = [1 for _ in vals]
-    ax1.pie(vals, labels=cats, autopct='%1.1f%%', startangle=140)
-    ax1.set_title("Category Breakdown")
-    canvas1 = FigureCanvasTkAgg(fig1, analytic_win)
-    canvas1.get_tk_widget().pack(side="left", fill="both", expand=True, padx=10, pady=10)
-
-    fig2 = plt.Figure(figsize=(4.5, 4), dpi=80)
-    ax2 = fig2.add_subplot(111)
-    ax2.bar(m_labels, m_values)
-    ax2.set_title("Monthly Totals")
-    ax2.set_ylabel("Amount (₹)")
-    ax2.tick_params(axis='x', rotation=30)
-    canvas2 = FigureCanvasTkAgg(fig2, analytic_win)
-    canvas2.get_tk_widget().pack(side="left", fill="both", expand=True, padx=10, pady=10)
+    notebook = ttk.Notebook(analytic_win)
+    notebook.pack(fill="both", expand=True, padx=10, pady=10)
+    tabs = {}
+    for name in ANALYTICS_CHARTS:
+        label = tk.Label(notebook)
+        notebook.add(label, text=name)
+        tabs[str(label)] = (name, label)
+
+    def show_tab(event=None):
+        # Charts are drawn the first time their tab is shown
+        name, label = tabs[notebook.select()]
+        if getattr(label, "image", None) is None:
+            label.image = tk.PhotoImage(data=chart_image(name))
+            label.configure(image=label.image)
+
+    notebook.bind("<<NotebookTabChanged>>", show_tab)
+    show_tab()
+
+# --------------------- Analytics ---------------------
+
+ANALYTICS_CHARTS = ("Overview", "Daily Trend", "Top Categories", "Weekdays")
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Aggregates and rendered charts for one version of `expenses`; reopening
+# Analytics without changes in between reuses them as they are.
+analytics_cache = {"version": None, "summary": None, "images": {}}
+
+def analytics_summary(store):
+    """
+    Group the store's columns by month, category, weekday and day with
+    NumPy. Amounts are summed from integer cents.
+    """
+    np = heavy_import("numpy")
+    store.compact()
+    dates = np.frombuffer(store.dates.tobytes(), dtype=np.int32)
+    cents = np.frombuffer(store.cents.tobytes(), dtype=np.int64)
+    cats = np.frombuffer(store.cats.tobytes(), dtype=np.uint16)
+
+    epoch = datetime(1970, 1, 1).toordinal()
+    months = (dates - epoch).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    month_keys, month_index = np.unique(months, return_inverse=True)
+    month_totals = np.bincount(month_index, weights=cents) / 100
+
+    cat_counts = np.bincount(cats, minlength=len(store.categories))
+    cat_totals = np.bincount(cats, weights=cents, minlength=len(store.categories)) / 100
+    present = np.flatnonzero(cat_counts)
+
+    # ordinal 1 (0001-01-01) was a Monday
+    weekday_totals = np.bincount((dates - 1) % 7, weights=cents, minlength=7) / 100
+
+    first = int(dates.min())
+    daily = np.bincount(dates - first, weights=cents) / 100
+    running = np.concatenate(([0.0], np.cumsum(daily)))
+    end = np.arange(1, len(daily) + 1)
+    start = np.maximum(0, end - 30)
+    rolling = (running[end] - running[start]) / (end - start)
+
+    return {
+        "months": [(1970 + int(k) // 12, int(k) % 12 + 1) for k in month_keys],
+        "month_totals": month_totals,
+        "categories": [store.categories[c] for c in present],
+        "category_totals": cat_totals[present],
+        "weekday_totals": weekday_totals,
+        "days": np.arange(first - epoch, first - epoch + len(daily)).astype("datetime64[D]"),
+        "daily": daily,
+        "rolling30": rolling,
+    }
+
+def analytics_data():
+    if analytics_cache["version"] != expenses.version:
+        analytics_cache.update(version=expenses.version, summary=analytics_summary(expenses), images={})
+    return analytics_cache["summary"]
+
+def chart_image(name):
+    """Base64 PNG of chart `name` for the current data, rendered at most once."""
+    data = analytics_data()
+    images = analytics_cache["images"]
+    if name not in images:
+        Figure, FigureCanvasAgg = load_matplotlib()
+        fig = Figure(figsize=(10.5, 4.6), dpi=80)
+        draw_chart(fig, name, data)
+        fig.tight_layout()
+        buf = io.BytesIO()
+        FigureCanvasAgg(fig).print_png(buf)
+        images[name] = base64.b64encode(buf.getvalue()).decode("ascii")
+    return images[name]
+
+def draw_chart(fig, name, data):
+    if name == "Overview":
+        ax1 = fig.add_subplot(121)
+        cats = data["categories"]
+        vals = list(data["category_totals"])
+        if sum(vals) == 0:
+            vals = [1 for _ in vals]
+        ax1.pie(vals, labels=cats, autopct='%1.1f%%', startangle=140)
+        ax1.set_title("Category Breakdown")
+
+        ax2 = fig.add_subplot(122)
+        m_labels = [datetime(y, m, 1).strftime("%b %Y") for y, m in data["months"]]
+        ax2.bar(m_labels, data["month_totals"])
+        ax2.set_title("Monthly Totals")
+        ax2.set_ylabel("Amount (₹)")
+        ax2.tick_params(axis='x', rotation=30)
+    elif name == "Daily Trend":
+        ax = fig.add_subplot(111)
+        ax.bar(data["days"], data["daily"], color="#A29BFE", label="Daily total")
+        ax.plot(data["days"], data["rolling30"], color="#D63031", label="30-day average")
+        ax.set_title("Daily Spending")
+        ax.set_ylabel("Amount (₹)")
+        ax.legend()
+        fig.autofmt_xdate()
+    elif name == "Top Categories":
+        ax = fig.add_subplot(111)
+        order = data["category_totals"].argsort()[-10:]
+        ax.barh([data["categories"][i] for i in order], data["category_totals"][order], color="#6C5CE7")
+        ax.set_title("Top Categories")
+        ax.set_xlabel("Amount (₹)")
+    elif name == "Weekdays":
+        ax = fig.add_subplot(111)
+        ax.bar(WEEKDAYS, data["weekday_totals"], color="#00B894")
+        ax.set_title("Spending by Weekday")
+        ax.set_ylabel("Amount (₹)")
+
+# --------------------- PDF report ---------------------
+
+PDF_LINE_HEIGHT = 6
+PDF_COLUMNS = ((40, "Date", "C"), (40, "Category", "C"), (40, "Amount", "R"), (70, "Note", "L"))
+
+def pdf_text(text):
+    # The core PDF fonts are Latin-1 only
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+def pdf_table_header(pdf):
+    pdf.set_font("Arial", "B", 10)
+    for width, title, _ in PDF_COLUMNS:
+        pdf.cell(width, 8, title, 1, 0, "C")
+    pdf.ln()
+    pdf.set_font("Arial", size=10)
+
+def pdf_row(pdf, cells, bold=False):
+    """One table row; the last cell wraps onto as many lines as it needs."""
+    last_width = PDF_COLUMNS[-1][0]
+    lines = pdf.multi_cell(last_width, PDF_LINE_HEIGHT, cells[-1], split_only=True) or [""]
+    height = PDF_LINE_HEIGHT * len(lines)
+    if pdf.get_y() + height > pdf.page_break_trigger:
+        pdf.add_page()
+        pdf_table_header(pdf)
+    if bold:
+        pdf.set_font("Arial", "B", 10)
+    for (width, _, align), text in zip(PDF_COLUMNS, cells[:-1]):
+        pdf.cell(width, height, text, 1, 0, align)
+    pdf.multi_cell(last_width, PDF_LINE_HEIGHT, cells[-1], 1, PDF_COLUMNS[-1][2])
+    if bold:
+        pdf.set_font("Arial", size=10)
+
+@instrumented
+def write_pdf_report(filename, store, ids, grouped, totals, job, cancel):
+    """
+    Lay out the report for the expenses `ids` of `store`, page by page, on a
+    worker thread. Progress goes into job["done"]; setting `cancel` stops
+    it before anything is written.
+    `totals` is (month totals, category totals) from the rollup when the
+    report covers the whole ledger; otherwise subtotals are summed while
+    the rows stream past.
+    """
+    pdf = heavy_import("fpdf").FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, "Expense Report", ln=True, align="C")
+    pdf.ln(4)
+    pdf_table_header(pdf)
+
+    if grouped:
+        ids = sorted(ids, key=lambda x: store.dates[store.slot_of(x)])
+    month_totals, category_totals = totals if totals else ({}, None)
+    running = {}            # (year, month) -> cents, when not from the rollup
+    by_category = {}        # category -> cents, when not from the rollup
+    current = None
+    grand_cents = 0
+
+    def close_month(month):
+        cents = month_totals.get(month, running[month])
+        label = datetime(month[0], month[1], 1).strftime("%B %Y")
+        pdf_row(pdf, ("", "", f"{cents / 100:.2f}", f"Subtotal {label}"), bold=True)
+
+    for done, expense_id in enumerate(ids):
+        if cancel.is_set():
+            return
+        i = store.slot_of(expense_id)
+        month = ordinal_month(store.dates[i])
+        category = store.categories[store.cats[i]]
+        cents = store.cents[i]
+        if grouped and month != current:
+            if current is not None:
+                close_month(current)
+            current = month
+        running[month] = running.get(month, 0) + cents
+        by_category[category] = by_category.get(category, 0) + cents
+        grand_cents += cents
+        pdf_row(pdf, (ordinal_to_date(store.dates[i]), pdf_text(category),
+                      f"{cents / 100:.2f}", pdf_text(store.note_pool[store.notes[i]])))
+        job["done"] = done + 1
+    if grouped and current is not None:
+        close_month(current)
+
+    if grouped:
+        if category_totals is None:
+            category_totals = {c: cents / 100 for c, cents in by_category.items()}
+        pdf.ln(6)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 8, "Totals by Category", ln=True)
+        pdf.set_font("Arial", size=10)
+        for category, total in category_totals.items():
+            pdf.cell(80, 7, pdf_text(category), 1, 0, "L")
+            pdf.cell(40, 7, f"{total:.2f}", 1, 1, "R")
+        pdf.set_font("Arial", "B", 10)
+        pdf.cell(80, 7, "Total", 1, 0, "L")
+        pdf.cell(40, 7, f"{grand_cents / 100:.2f}", 1, 1, "R")
+
+    if cancel.is_set():
+        return
+    pdf.output(filename)
+
+# --------------------- CSV export ---------------------
+
+EXPORT_PROGRESS_ROWS = 10000
+
+def export_rows(store, ids, categories, job, cancel):
+    """
+    Yield [date, category, amount, note] for the expenses `ids` of `store`
+    (every row when `ids` is None), keeping only `categories` when given.
+    Rows are produced one at a time, so memory stays flat however many
+    there are. Amounts are the stored values, not table strings.
+    """
+    codes = None
+    if categories is not None:
+        codes = {code for code, category in enumerate(store.categories) if category in categories}
+    slots = range(len(store)) if ids is None else map(store.slot_of, ids)
+    for n, i in enumerate(slots, 1):
+        if n % EXPORT_PROGRESS_ROWS == 0:
+            if cancel.is_set():
+                return
+            job["done"] = n
+        if i is None or (codes is not None and store.cats[i] not in codes):
+            continue
+        yield [ordinal_to_date(store.dates[i]), store.categories[store.cats[i]],
+               store.cents[i] / 100, store.note_pool[store.notes[i]]]
+
+@instrumented
+def write_csv_export(filename, store, ids, categories, gzipped, job, cancel):
+    """
+    Stream the selected rows of `store` into `filename` (gzip-compressed
+    when `gzipped`). The file is written under a temporary name and only
+    renamed into place once complete, so a cancelled or failed export
+    leaves nothing behind.
+    """
+    tmp_name = filename + ".tmp"
+    if gzipped:
+        # Level 6 (gzip's own default) is several times faster than 9 for ~5% more bytes
+        f = gzip.open(tmp_name, "wt", compresslevel=6, newline="", encoding="utf-8")
+    else:
+        f = open(tmp_name, "w", newline="", encoding="utf-8")
+    try:
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(["Date", "Category", "Amount", "Note"])
+            written = 0
+            for row in export_rows(store, ids, categories, job, cancel):
+                writer.writerow(row)
+                written += 1
+        if cancel.is_set():
+            os.remove(tmp_name)
+            return
+        os.replace(tmp_name, filename)
+        job["done"] = written
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+# --------------------- Bulk import ---------------------
+
+IMPORT_FIELDS = ("Date", "Category", "Amount", "Note")
+# Header words that identify each field in bank-statement exports
+IMPORT_HINTS = {
+    "Date": ("date", "posted", "time"),
+    "Category": ("category", "type"),
+    "Amount": ("amount", "debit", "withdrawal", "value"),
+    "Note": ("note", "description", "narration", "details", "memo", "remarks", "particulars", "payee"),
+}
+IMPORT_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d/%m/%y",
+                       "%d-%m-%Y", "%d-%b-%Y", "%d %b %Y", "%d.%m.%Y")
+IMPORT_CHUNK_ROWS = 10000
+IMPORT_DEFAULT_CATEGORY = "Other"
+
+def read_import_header(filename, sample_rows=50):
+    """The header row and the first `sample_rows` rows of `filename`."""
+    with open(filename, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        return header, list(itertools.islice(reader, sample_rows))
+
+def guess_import_mapping(header):
+    """field -> column index for the columns whose names match IMPORT_HINTS."""
+    mapping = {}
+    for field in IMPORT_FIELDS:
+        for i, name in enumerate(header):
+            if i not in mapping.values() and any(hint in name.lower() for hint in IMPORT_HINTS[field]):
+                mapping[field] = i
+                break
+    return mapping
+
+def guess_date_format(values):
+    """The first of IMPORT_DATE_FORMATS that parses every sample value."""
+    values = [v.strip() for v in values if v.strip()]
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            for v in values:
+                datetime.strptime(v, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return DATE_FORMAT
+
+def parse_import_amount(text):
+    # Signed cents: "1,234.50" and "₹ 99" are positive, "-12.00", "-₹12"
+    # and "(12.00)" negative
+    text = text.strip()
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()").replace(",", "").strip("₹$€£ ")
+    if text[:1] in ("-", "+"):
+        negative = negative or text[0] == "-"
+        text = text[1:].lstrip("₹$€£ ")
+    cents = amount_to_cents(text)
+    return -cents if negative else cents
+
+@instrumented
+def read_import_rows(filename, mapping, date_format, store, job, cancel):
+    """
+    Stream `filename` in chunks of IMPORT_CHUNK_ROWS rows and turn them
+    into [date, category, amount, note] rows using `mapping` (field ->
+    column index).
+    When the amounts have both signs, the more common sign is taken as
+    spending and the other rows (credits, refunds) are left out.
+    Rows already in `store` are skipped using a hash index of row contents.
+    The index counts each key, so a statement that really has the same
+    purchase twice in a day keeps both copies, and importing the same file
+    again adds nothing.
+    Returns (rows, unreadable count, duplicate count, credit count).
+    """
+    existing = Counter(
+        (d, store.categories[c], cents, store.note_pool[n])
+        for d, c, cents, n in zip(store.dates, store.cats, store.cents, store.notes))
+    date_col = mapping["Date"]
+    amount_col = mapping["Amount"]
+    category_col = mapping.get("Category")
+    note_col = mapping.get("Note")
+    dates = {}   # date text -> (ordinal, DATE_FORMAT text); statements repeat dates a lot
+    parsed, invalid = [], 0
+
+    with open(filename, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        while not cancel.is_set():
+            chunk = list(itertools.islice(reader, IMPORT_CHUNK_ROWS))
+            if not chunk:
+                break
+            for record in chunk:
+                try:
+                    text = record[date_col].strip()
+                    date = dates.get(text)
+                    if date is None:
+                        day = datetime.strptime(text, date_format)
+                        date = dates[text] = (day.toordinal(), day.strftime(DATE_FORMAT))
+                    cents = parse_import_amount(record[amount_col])
+                except (IndexError, ValueError):
+                    invalid += 1
+                    continue
+                category = record[category_col].strip() if category_col is not None and category_col < len(record) else ""
+                category = category or IMPORT_DEFAULT_CATEGORY
+                note = record[note_col].strip() if note_col is not None and note_col < len(record) else ""
+                parsed.append((date, category, cents, note))
+            job["done"] += len(chunk)
+
+    spending_negative = sum(1 for _, _, cents, _ in parsed if cents < 0) * 2 > len(parsed)
+    rows, duplicates, credits = [], 0, 0
+    for date, category, cents, note in parsed:
+        if cents and (cents < 0) != spending_negative:
+            credits += 1
+            continue
+        cents = abs(cents)
+        key = (date[0], category, cents, note)
+        if existing[key] > 0:
+            existing[key] -= 1
+            duplicates += 1
+            continue
+        rows.append([date[1], category, cents / 100, note])
+    return rows, invalid, duplicates, credits
+
+# --------------------- Budgets ---------------------
+
+BUDGET_WARN_AT = 0.8   # default share of a limit at which a rule warns
+BUDGET_OK, BUDGET_WARNING, BUDGET_OVER = 0, 1, 2
+
+def budgets_filename(username):
+    return f"budgets_{username}.json" if username else "budgets.json"
+
+class BudgetIndex(StoreIndex):
+    """
+    Monthly spending limits, on all spending or on one category, with each
+    rule's running spend per month. Adding or removing a row updates the
+    rules it matches in O(1), so checking budgets never rescans the ledger.
+    `levels` remembers where each rule last stood, so an alert fires when a
+    limit is crossed rather than on every change after that.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)   # {"category": name or None, "limit": cents, "warn_at": fraction}
+        self.spent = {}            # (rule number, (year, month)) -> cents
+        self.levels = {}           # (rule number, (year, month)) -> BUDGET_* level
+        self.touched = set()       # months changed since the last check()
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        return cls({"category": rule.get("category") or None,
+                    "limit": round(float(rule["limit"]) * 100),
+                    "warn_at": float(rule.get("warn_at", BUDGET_WARN_AT))} for rule in data.get("rules", []))
+
+    def save(self, filename):
+        rules = [{"category": rule["category"], "limit": rule["limit"] / 100, "warn_at": rule["warn_at"]}
+                 for rule in self.rules]
+        tmp_name = filename + ".tmp"
+        with open(tmp_name, "w") as f:
+            json.dump({"rules": rules}, f, indent=2)
+        os.replace(tmp_name, filename)
+
+    def build(self, store):
+        # Sum per day (all-spending rules) and per (day, category) for the
+        # categories that have rules, then fold the days into months
+        by_day = defaultdict(int)
+        by_day_cat = defaultdict(int)
+        if any(rule["category"] is None for rule in self.rules):
+            for ordinal, cents in zip(store.dates, store.cents):
+                by_day[ordinal] += cents
+        codes = {store.category_codes[rule["category"]] for rule in self.rules
+                 if rule["category"] in store.category_codes}
+        if codes:
+            for ordinal, cat, cents in zip(store.dates, store.cats, store.cents):
+                if cat in codes:
+                    by_day_cat[(ordinal, cat)] += cents
+        spent = defaultdict(int)
+        for n, rule in enumerate(self.rules):
+            if rule["category"] is None:
+                for ordinal, cents in by_day.items():
+                    spent[(n, ordinal_month(ordinal))] += cents
+            else:
+                code = store.category_codes.get(rule["category"])
+                for (ordinal, cat), cents in by_day_cat.items():
+                    if cat == code:
+                        spent[(n, ordinal_month(ordinal))] += cents
+        # Levels are kept and the months whose spend changed are marked, so
+        # check() still reports a limit crossed by a bulk rebuild (an import)
+        for key in spent.keys() | self.spent.keys():
+            if spent.get(key, 0) != self.spent.get(key, 0):
+                self.touched.add(key[1])
+        self.spent = dict(spent)
+
+    def prime(self):
+        """Take the current spend as already seen: no alerts until it changes."""
+        self.levels = {key: self.level(key[0], cents) for key, cents in self.spent.items()}
+        self.touched = set()
+
+    def add(self, store, i):
+        self._apply(store, i, 1)
+
+    def remove(self, store, i):
+        self._apply(store, i, -1)
+
+    def _apply(self, store, i, sign):
+        month = ordinal_month(store.dates[i])
+        category = store.categories[store.cats[i]]
+        cents = sign * store.cents[i]
+        for n, rule in enumerate(self.rules):
+            if rule["category"] is None or rule["category"] == category:
+                key = (n, month)
+                self.spent[key] = self.spent.get(key, 0) + cents
+        self.touched.add(month)
+
+    def level(self, n, cents):
+        rule = self.rules[n]
+        if cents > rule["limit"]:
+            return BUDGET_OVER
+        if cents >= rule["limit"] * rule["warn_at"]:
+            return BUDGET_WARNING
+        return BUDGET_OK
+
+    def check(self):
+        """Rules that moved up a level since the last check, as (rule, month, cents, level)."""
+        crossed = []
+        for month in self.touched:
+            for n, rule in enumerate(self.rules):
+                key = (n, month)
+                cents = self.spent.get(key, 0)
+                level = self.level(n, cents)
+                if level > self.levels.get(key, BUDGET_OK):
+                    crossed.append((rule, month, cents, level))
+                self.levels[key] = level
+        self.touched.clear()
+        return crossed
+
+    def status(self, month):
+        """(rule, cents, level) of the rules at a warning or over their limit in `month`."""
+        result = []
+        for n, rule in enumerate(self.rules):
+            cents = self.spent.get((n, month), 0)
+            level = self.level(n, cents)
+            if level > BUDGET_OK:
+                result.append((rule, cents, level))
+        return result
+
+def attach_budgets(store):
+    """(Re)build the user's budget rules over `store` and keep them updated with it."""
+    if budgets in store.indexes:
+        store.indexes.remove(budgets)
+    store.compact()
+    budgets.build(store)
+    budgets.prime()
+    if budgets.rules:
+        store.indexes.append(budgets)
+
+def budget_text(rule, cents, level, month=None):
+    name = rule["category"] or "All spending"
+    when = f" in {datetime(month[0], month[1], 1).strftime('%b %Y')}" if month else ""
+    state = "Over budget" if level == BUDGET_OVER else "Near budget"
+    return f"{state}{when} – {name}: ₹ {cents / 100:.2f} of ₹ {rule['limit'] / 100:.2f}"
+
+# --------------------- Batch reports ---------------------
+
+def batch_report_user(task):
+    """
+    Load one user's ledger and write its reports, without any Tk state.
+    Runs in a worker process; returns the user's aggregates and timings.
+    `month` is (year, month), or None for the whole ledger.
+    """
+    username, month, out_dir, with_pdf = task
+    began = time.perf_counter()
+    # Read only: the user may have the app open on this ledger
+    repository = open_repository(username)
+    try:
+        store = repository.load(read_only=True)
+    finally:
+        repository.close()
+    loaded = time.perf_counter()
+
+    if month:
+        ids = store.by_date.month(*month)
+        totals = None
+    else:
+        ids = store.by_date.ordered_ids()
+        totals = ({month: cents for month, (cents, _) in store.rollup.months.items()},
+                  store.rollup.category_totals())
+    tag = f"{month[0]:04d}-{month[1]:02d}" if month else "all"
+    base = os.path.join(out_dir, f"{username}_{tag}")
+
+    by_category = {}
+    total_cents = 0
+    with open(base + ".csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Category", "Amount", "Note"])
+        for expense_id in ids:
+            i = store.slot_of(expense_id)
+            category = store.categories[store.cats[i]]
+            cents = store.cents[i]
+            by_category[category] = by_category.get(category, 0) + cents
+            total_cents += cents
+            writer.writerow([ordinal_to_date(store.dates[i]), category, cents / 100,
+                             store.note_pool[store.notes[i]]])
+    if with_pdf and ids:
+        write_pdf_report(base + ".pdf", store, ids, True, totals, {"done": 0}, threading.Event())
+    finished = time.perf_counter()
+
+    return {
+        "user": username,
+        "rows": len(ids),
+        "total": total_cents / 100,
+        "categories": {c: cents / 100 for c, cents in sorted(by_category.items())},
+        "load_s": round(loaded - began, 4),
+        "report_s": round(finished - loaded, 4),
+    }
+
+def run_batch_reports(out_dir, month=None, workers=None, with_pdf=True):
+    """
+    Write the reports of every user with an expenses_<user>.csv into
+    `out_dir`, one user per task on a process pool, followed by
+    summary.json with each user's aggregates and timings.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    users = ledger_users()
+    began = time.perf_counter()
+    results, failures = [], {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(batch_report_user, (u, month, out_dir, with_pdf)): u for u in users}
+        for future in as_completed(pending):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures[pending[future]] = repr(e)
+    results.sort(key=lambda r: r["user"])
+    summary = {
+        "month": f"{month[0]:04d}-{month[1]:02d}" if month else "all",
+        "workers": workers or os.cpu_count(),
+        "users": results,
+        "failed": failures,
+        "wall_s": round(time.perf_counter() - began, 4),
+        "worker_s": round(sum(r["load_s"] + r["report_s"] for r in results), 4),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def batch_reports_main(argv):
+    parser = argparse.ArgumentParser(prog="expense.py --batch-reports",
+                                     description="Write reports for every user without opening the GUI.")
+    parser.add_argument("--month", help="YYYY-MM to report on (default: the whole ledger)")
+    parser.add_argument("--out", default="reports", help="output directory (default: reports)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--no-pdf", action="store_true", help="write the CSV reports only")
+    args = parser.parse_args([a for a in argv if a != "--batch-reports"])
+    month = None
+    if args.month:
+        try:
+            picked = datetime.strptime(args.month, "%Y-%m")
+        except ValueError:
+            parser.error(f"--month must look like 2024-03, not {args.month!r}")
+        month = (picked.year, picked.month)
+
+    summary = run_batch_reports(args.out, month, args.workers, not args.no_pdf)
+    for r in summary["users"]:
+        print(f"{r['user']:<20} {r['rows']:>8} rows  {r['total']:>12.2f}  "
+              f"load {r['load_s']:.3f}s  report {r['report_s']:.3f}s")
+    for user, error in summary["failed"].items():
+        print(f"{user:<20} FAILED {error}")
+    print(f"{len(summary['users'])} users in {summary['wall_s']:.3f}s on {summary['workers']} workers "
+          f"({summary['worker_s']:.3f}s of worker time)")
+    return 1 if summary["failed"] else 0
 
 # --------------------- Table action handling ---------------------
 
@@ -277,18 +3065,17 @@ def on_tree_click(event):
         actions_x = event.x - x_offset
         actions_width = tree.column("#5", option="width")
         if actions_x <= actions_width / 2:
-            index = tree.index(rowid)
-            populate_fields_for_edit(index=index)
+            populate_fields_for_edit(expense_id=int(rowid))
         else:
-            idx = tree.index(rowid)
+            expense_id = int(rowid)
+            if expenses.slot_of(expense_id) is None:
+                return
             confirm = messagebox.askyesno("Delete", "Delete selected expense?")
             if confirm:
-                try:
-                    expenses.pop(idx)
-                except:
-                    pass
+                row = expenses.delete(expense_id)
                 update_table()
-                save_to_csv()
+                if not record_change("delete", [row], lambda: expenses.upsert(row)):
+                    return
                 update_monthly_total()
 
 # --------------------------- UI BUILD (dark theme + gradients) ---------------------------
@@ -319,10 +3106,11 @@ def make_gradient_button(parent, text, command, width=120, height=34, start_colo
 
 def open_main_app(username):
     global amount_entry, category_var, category_dropdown, date_entry, note_entry
-    global tree, monthly_total_label, filter_entry, root, dark_bg, current_user
+    global tree, vsb, monthly_total_label, budget_label, filter_entry, root, dark_bg, current_user, repository
 
     # Set current user immediately
     current_user = username
+    repository = open_repository(username)
 
     root = tk.Tk()
     root.title(f"Expense Tracker - {username}")
@@ -355,6 +3143,7 @@ def open_main_app(username):
     make_gradient_button(btn_frame, "Update Expense", lambda: edit_expense()).pack(pady=6)
     make_gradient_button(btn_frame, "Export CSV", lambda: export_to_csv()).pack(pady=6)
     make_gradient_button(btn_frame, "Export PDF", lambda: export_to_pdf(), start_color="#FF7F50", end_color="#FF6B6B").pack(pady=6)
+    make_gradient_button(btn_frame, "Import CSV", lambda: import_from_csv(), start_color="#00B894", end_color="#2AB07F").pack(pady=6)
 
     small_frame = tk.Frame(sidebar, bg=panel_bg)
     small_frame.pack(side="bottom", pady=18)
@@ -362,6 +3151,8 @@ def open_main_app(username):
     btn_cal.pack(fill="x", padx=10, pady=4)
     btn_analytic = tk.Button(small_frame, text="Analytics", command=show_analytics, bg="#2D3436", fg=text_fg, relief="flat")
     btn_analytic.pack(fill="x", padx=10, pady=4)
+    btn_budgets = tk.Button(small_frame, text="Budgets", command=show_budgets, bg="#2D3436", fg=text_fg, relief="flat")
+    btn_budgets.pack(fill="x", padx=10, pady=4)
     btn_exit = tk.Button(small_frame, text="Exit", command=close_app, bg="#b33939", fg="white", relief="flat")
     btn_exit.pack(fill="x", padx=10, pady=6)
 
@@ -388,14 +3179,14 @@ def open_main_app(username):
     lbl_cat.grid(row=0, column=2, sticky="w", padx=4)
     category_var = tk.StringVar()
     category_dropdown = ttk.Combobox(form_card, textvariable=category_var,
-                                     values=["Food", "Transport", " card-Bills", "Shopping","electricity-bills", "Other"],
+                                     values=CATEGORIES,
                                      state="readonly", width=18)
     category_dropdown.set("Food")
     category_dropdown.grid(row=0, column=3, padx=6)
 
     lbl_date = tk.Label(form_card, text="Date", bg=subtle, fg=text_fg)
     lbl_date.grid(row=0, column=4, sticky="w", padx=4)
-    date_entry = DateEntry(form_card, width=12, date_pattern="mm/dd/yy")
+    date_entry = heavy_import("tkcalendar").DateEntry(form_card, width=12, date_pattern="mm/dd/yy")
     date_entry.grid(row=0, column=5, padx=6)
 
     lbl_note = tk.Label(form_card, text="Note", bg=subtle, fg=text_fg)
@@ -428,9 +3219,9 @@ def open_main_app(username):
     columns = ("Date", "Category", "Amount", "Note", "Actions")
     tree = ttk.Treeview(table_card, columns=columns, show="headings")
     tree.pack(fill="both", expand=True, side="left")
-    vsb = ttk.Scrollbar(table_card, orient="vertical", command=tree.yview)
+    # The scrollbar drives the virtual window in scroll_table(), not tree.yview
+    vsb = ttk.Scrollbar(table_card, orient="vertical", command=scroll_table)
     vsb.pack(side="right", fill="y")
-    tree.configure(yscrollcommand=vsb.set)
 
     tree.heading("Date", text="Date")
     tree.heading("Category", text="Category")
@@ -445,28 +3236,127 @@ def open_main_app(username):
 
     tree.bind("<ButtonRelease-1>", on_tree_click)
     tree.bind("<Double-1>", lambda e: populate_fields_for_edit(e))
+    tree.bind("<Configure>", on_table_resize)
+    tree.bind("<MouseWheel>", on_table_wheel)
+    tree.bind("<Button-4>", on_table_wheel)
+    tree.bind("<Button-5>", on_table_wheel)
+    tree.bind("<Up>", lambda e: on_table_key(e, -1))
+    tree.bind("<Down>", lambda e: on_table_key(e, 1))
 
     bottom_bar = tk.Frame(main, bg=dark_bg)
     bottom_bar.pack(fill="x", pady=(6,0))
 
     monthly_total_label = tk.Label(bottom_bar, text="This Month's Total: ₹ 0.00", bg=dark_bg, fg=text_fg, font=("Segoe UI", 11, "bold"))
     monthly_total_label.pack(side="left", padx=8)
+    budget_label = tk.Label(bottom_bar, text="", bg=dark_bg, fg="#FDCB6E", font=("Segoe UI", 10))
+    budget_label.pack(side="left", padx=8)
 
     search_frame = tk.Frame(bottom_bar, bg=dark_bg)
     search_frame.pack(side="right", padx=8)
     tk.Label(search_frame, text="Search:", bg=dark_bg, fg="#A9B0C0").pack(side="left")
     filter_entry = tk.Entry(search_frame, width=18, bg="#2A2B33", fg=text_fg, insertbackground=text_fg, relief="flat")
     filter_entry.pack(side="left", padx=6)
+    filter_entry.bind("<KeyRelease>", schedule_live_search)
     tk.Button(search_frame, text="Filter", command=filter_expenses, bg="#2D3436", fg=text_fg, relief="flat").pack(side="left", padx=4)
     tk.Button(search_frame, text="Clear Filter", command=lambda: (filter_entry.delete(0, tk.END), update_table(), update_monthly_total()), bg="#2D3436", fg=text_fg, relief="flat").pack(side="left", padx=4)
 
+    mark_startup("main window built")
+
     # Load and populate for this user (ensure state is fresh)
-    load_from_csv()
+    load_expenses()
+    mark_startup("ledger loaded")
     update_table()
     update_monthly_total()
+    mark_startup("table populated")
+
+    start_io_worker()
+    poll_io_errors()
+    root.protocol("WM_DELETE_WINDOW", close_app)
+    root.bind("<Control-D>", show_diagnostics)   # Ctrl+Shift+D
 
     root.mainloop()
 
+# --------------------------- USER DIRECTORY --------------------------- #
+
+USERS_FILE = "users.txt"
+user_index = {}          # username -> password, as read from USERS_FILE
+user_index_stamp = None  # (mtime_ns, size) of USERS_FILE when user_index was built
+
+def users_file_stamp():
+    try:
+        st = os.stat(USERS_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def read_user_index(f):
+    index = {}
+    for line in f:
+        parts = line.strip().split(":")
+        if len(parts) >= 2:
+            index.setdefault(parts[0], parts[1])  # first entry wins, as the old scan did
+    return index
+
+def load_user_index():
+    """
+    Return the username -> password index of USERS_FILE.
+    The file is only re-read when its mtime or size changed, so a login is a
+    dict lookup instead of a scan of every account.
+    """
+    global user_index, user_index_stamp
+    stamp = users_file_stamp()
+    if stamp != user_index_stamp:
+        if stamp is None:
+            user_index = {}
+        else:
+            with open(USERS_FILE, "r") as f:
+                user_index = read_user_index(f)
+        user_index_stamp = stamp
+    return user_index
+
+def lock_users_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def unlock_users_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def check_login(username, password):
+    return load_user_index().get(username) == password
+
+def register_user(username, password):
+    """
+    Append `username` to USERS_FILE. Returns False if the name is taken.
+    The membership check and the append happen under an exclusive lock on
+    the file, re-reading it there, so two apps registering at the same time
+    can't both add the same name or interleave their lines.
+    """
+    global user_index, user_index_stamp
+    with open(USERS_FILE, "a+") as f:
+        lock_users_file(f)
+        try:
+            f.seek(0)
+            index = read_user_index(f)
+            if username in index:
+                user_index, user_index_stamp = index, users_file_stamp()
+                return False
+            f.seek(0, os.SEEK_END)
+            f.write(f"{username}:{password}\n")
+            f.flush()
+            os.fsync(f.fileno())
+            index[username] = password
+            user_index, user_index_stamp = index, users_file_stamp()
+        finally:
+            unlock_users_file(f)
+    return True
+
 # --------------------------- LOGIN SCREEN --------------------------- #
 
 def login_screen():
@@ -477,23 +3367,11 @@ def login_screen():
             messagebox.showerror("Error", "Please enter both username and password.")
             return
 
-        if not os.path.exists("users.txt"):
-            with open("users.txt", "w") as _:
-                pass
-
-        with open("users.txt", "r") as f:
-            users = f.readlines()
-
-        for u in users:
-            parts = u.strip().split(":")
-            if len(parts) < 2:
-                continue
-            stored_user, stored_pass = parts[0], parts[1]
-            if stored_user == username and stored_pass == password:
-                messagebox.showinfo("Success", f"Welcome back, {username}!")
-                login_win.destroy()
-                open_main_app(username)
-                return
+        if check_login(username, password):
+            messagebox.showinfo("Success", f"Welcome back, {username}!")
+            login_win.destroy()
+            open_main_app(username)
+            return
 
         messagebox.showerror("Login Failed", "Incorrect username or password.")
 
@@ -504,23 +3382,22 @@ def login_screen():
             messagebox.showerror("Error", "Please enter both username and password.")
             return
 
-        if not os.path.exists("users.txt"):
-            with open("users.txt", "w") as _:
-                pass
-
-        with open("users.txt", "r") as f:
-            users = [line.strip().split(":")[0] for line in f.readlines() if ":" in line]
+        if ":" in username or ":" in password:
+            messagebox.showerror("Error", "Username and password can't contain ':'.")
+            return
 
-        if username in users:
+        try:
+            registered = register_user(username, password)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not register user: {e}")
+            return
+        if not registered:
             messagebox.showerror("Error", "Username already exists.")
             return
 
-        with open("users.txt", "a") as f:
-            f.write(f"{username}:{password}\n")
-
         # Auto-create user's personal CSV file
         try:
-            filename = f"expenses_{username}.csv"
+            filename = user_csv_filename(username)
             if not os.path.exists(filename):
                 with open(filename, "w", newline="") as f_csv:
                     writer = csv.writer(f_csv)
@@ -554,12 +3431,26 @@ def login_screen():
     tk.Button(button_frame, text="Login", command=login, bg="#6C5CE7", fg="white", width=12, relief="flat").pack(side="left", padx=8)
     tk.Button(button_frame, text="Register", command=register, bg="#2ECC71", fg="white", width=12, relief="flat").pack(side="left", padx=8)
 
+    def on_login_shown():
+        mark_startup("login window shown")
+        if PREWARM_IMPORTS:
+            prewarm_imports()
+
+    mark_startup("login window built")
+    login_win.after_idle(on_login_shown)
     login_win.mainloop()
 
 # --------------------------- START APP --------------------------- #
 
 if __name__ == "__main__":
-    if not os.path.exists("users.txt"):
-        with open("users.txt", "w") as f:
+    mark_startup("module imports")
+    if "--migrate-to-sqlite" in sys.argv[1:]:
+        for username in migrate_csv_to_sqlite():
+            print(f"migrated {username}")
+        sys.exit(0)
+    if "--batch-reports" in sys.argv[1:]:
+        sys.exit(batch_reports_main(sys.argv[1:]))
+    if not os.path.exists(USERS_FILE):
+        with open(USERS_FILE, "w") as f:
             pass
     login_screen()
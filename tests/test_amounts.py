@@ -0,0 +1,37 @@
+import csv
+
+import pytest
+
+import api_server
+import expense as app
+
+
+@pytest.mark.parametrize("amount", [1e17, float("inf"), float("-inf"), float("nan"), "1e400"])
+def test_bad_amount_leaves_store_unchanged(amount):
+    store = app.ExpenseStore([("01/05/25", "Food", 12.5, "lunch", 1)])
+    with pytest.raises(ValueError):
+        store.append(["01/06/25", "Food", amount, "", 2])
+    assert {len(getattr(store, name)) for name in app.ExpenseStore.COLUMNS} == {1}
+    assert list(store) == [["01/05/25", "Food", 12.5, "lunch", 1]]
+    store.append(["01/07/25", "Food", 3.0, "", 3])
+    assert [row[4] for row in store] == [1, 3]
+
+
+def test_bad_amount_in_csv_is_quarantined(data_dir):
+    repo = app.CsvRepository("u")
+    with open(repo.csv_name, "w", newline="") as f:
+        csv.writer(f).writerows([["Date", "Category", "Amount", "Note", "Id"],
+                                 ["01/05/25", "Food", "12.50", "lunch", "1"],
+                                 ["01/06/25", "Food", "inf", "", "2"],
+                                 ["01/07/25", "Food", "1e17", "", "3"]])
+    assert [row[4] for row in repo.load()] == [1]
+    with open(app.unreadable_filename(repo.csv_name), newline="") as f:
+        assert [row[4] for row in csv.reader(f)] == ["Id", "2", "3"]
+
+
+@pytest.mark.parametrize("amount", ["Infinity", "NaN", "1e17", '"inf"'])
+def test_api_rejects_bad_amount(amount):
+    body = f'{{"date": "01/05/25", "amount": {amount}}}'.encode()
+    with pytest.raises(api_server.ApiError) as e:
+        api_server.parse_expense(body, 1)
+    assert e.value.status == 400
@@ -0,0 +1,13 @@
+import asyncio
+
+import api_server
+import expense as app
+
+
+def test_bench_with_sqlite_backend(monkeypatch):
+    # Many clients writing to several users' ledgers in one database file
+    monkeypatch.setattr(app, "STORAGE_BACKEND", "sqlite")
+    result = asyncio.run(api_server.run_bench(clients=8, requests=25, users=3, rows=300,
+                                              write_share=50, cache_bytes=1 << 28))
+    assert result["requests"] == 8 * 25
+    assert result["errors"] == 0
@@ -0,0 +1,36 @@
+import csv
+import json
+import os
+
+import pytest
+
+import expense as app
+
+
+def write_ledger(username):
+    repo = app.CsvRepository(username)
+    with open(repo.csv_name, "w", newline="") as f:
+        csv.writer(f).writerows([["Date", "Category", "Amount", "Note", "Id"],
+                                 ["01/05/25", "Food", "12.50", "lunch", "1"],
+                                 ["13/40/25", "Food", "1.00", "bad date", "2"],
+                                 ["01/07/25", "Travel", "40.00", "train", "3"]])
+    with open(repo.journal_name, "w") as f:
+        f.write(json.dumps({"op": "add", "id": 4, "row": ["01/08/25", "Food", 7.5, ""]}) + "\n")
+        f.write('{"op": "add", "id": 5, "ro')   # torn by a crash
+    return repo
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_batch_report_leaves_the_ledger_alone(data_dir, monkeypatch, backend):
+    monkeypatch.setattr(app, "STORAGE_BACKEND", backend)
+    repo = write_ledger("u")
+    before = {name: open(name, "rb").read() for name in os.listdir(".")}
+    os.mkdir("out")
+    result = app.batch_report_user(("u", None, "out", False))
+    assert result["rows"] == 3
+    assert result["total"] == 60.0
+    # The SQLite database itself may be created, but nothing is migrated into it
+    after = {name: open(name, "rb").read() for name in os.listdir(".")
+             if name != "out" and not name.startswith(app.DB_FILENAME)}
+    assert after == before
+    assert not os.path.exists(app.binary_filename(repo.csv_name))
@@ -0,0 +1,56 @@
+import os
+
+import expense as app
+
+ROWS = [
+    ("01/05/25", "Food", "12.50", "lunch", 1),
+    ("01/06/25", "Travel", "40.00", "train", 2),
+    ("01/07/25", "Food", "3.25", "", 3),
+]
+
+
+def write_ledger(username):
+    repo = app.CsvRepository(username)
+    app.write_snapshot(repo.csv_name, app.ExpenseStore(ROWS))
+    assert os.path.exists(app.binary_filename(repo.csv_name))
+    return repo
+
+
+def test_binary_snapshot_round_trip(data_dir):
+    repo = write_ledger("u")
+    store = app.read_binary_snapshot(repo.csv_name)
+    assert store is not None
+    assert [row[4] for row in store] == [1, 2, 3]
+
+
+def test_truncated_binary_snapshot_falls_back_to_csv(data_dir):
+    repo = write_ledger("u")
+    with open(app.binary_filename(repo.csv_name), "r+b") as f:
+        f.truncate(app.BIN_HEADER.size)
+    assert app.read_binary_snapshot(repo.csv_name) is None
+    assert [row[4] for row in repo.load()] == [1, 2, 3]
+
+
+def test_binary_snapshot_cut_mid_column_falls_back_to_csv(data_dir):
+    repo = write_ledger("u")
+    filename = app.binary_filename(repo.csv_name)
+    with open(filename, "r+b") as f:
+        f.truncate(app.BIN_HEADER.size + 7)
+    assert app.read_binary_snapshot(repo.csv_name) is None
+    assert [row[4] for row in repo.load()] == [1, 2, 3]
+
+
+def test_binary_snapshot_missing_string_bytes_falls_back_to_csv(data_dir):
+    repo = write_ledger("u")
+    filename = app.binary_filename(repo.csv_name)
+    with open(filename, "r+b") as f:
+        f.truncate(os.path.getsize(filename) - 1)
+    assert app.read_binary_snapshot(repo.csv_name) is None
+    assert [row[4] for row in repo.load()] == [1, 2, 3]
+
+
+def test_empty_binary_snapshot_falls_back_to_csv(data_dir):
+    repo = write_ledger("u")
+    open(app.binary_filename(repo.csv_name), "wb").close()
+    assert app.read_binary_snapshot(repo.csv_name) is None
+    assert [row[4] for row in repo.load()] == [1, 2, 3]
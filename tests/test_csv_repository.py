@@ -0,0 +1,33 @@
+import os
+
+import expense as app
+
+ROWS = [("01/05/25", "Food", 12.5, "lunch", 1), ("01/06/25", "Travel", 40.0, "train", 2)]
+
+
+def stamps(repo):
+    # Compaction replaces the files, so the inode changes even within one mtime tick
+    return {name: (os.stat(name).st_ino, os.stat(name).st_mtime_ns)
+            for name in (repo.csv_name, repo.journal_name) if os.path.exists(name)}
+
+
+def test_close_without_changes_does_not_compact(data_dir):
+    repo = app.CsvRepository("u")
+    app.write_snapshot(repo.csv_name, app.ExpenseStore(ROWS))
+    app.reset_journal(repo.journal_name, 3)
+    before = stamps(repo)
+    repo.load()
+    repo.close()
+    assert stamps(repo) == before
+
+
+def test_close_folds_in_journaled_changes(data_dir):
+    repo = app.CsvRepository("u")
+    app.write_snapshot(repo.csv_name, app.ExpenseStore(ROWS))
+    store = repo.load()
+    row = ["01/07/25", "Food", 3.0, "", store.next_id]
+    store.append(row)
+    repo.record("add", row)
+    repo.close()
+    assert app.read_journal(repo.journal_name) == [("next_id", [None, None, None, None, 4])]
+    assert [row[4] for row in app.read_csv_snapshot(repo.csv_name)] == [1, 2, 3]
@@ -0,0 +1,32 @@
+import pytest
+
+import expense as app
+
+
+def write_ledger(filename, rows):
+    store = app.ExpenseStore(rows)
+    app.write_snapshot(filename, store)
+    return store
+
+
+def test_multiline_notes_across_block_boundaries(data_dir, monkeypatch):
+    rows = [("01/%02d/25" % (i % 28 + 1), "Food", float(i), f'line "{i}"\nline {i},b\n\nend' if i % 3 else "", i)
+            for i in range(1, 60)]
+    store = write_ledger("expenses_u.csv", rows)
+    for block in range(7, 120, 7):
+        monkeypatch.setattr(app, "CSV_TAIL_BLOCK", block)
+        assert app.read_csv_tail("expenses_u.csv", 0) == [list(row) for row in store]
+
+
+def test_old_statement_imported_after_recent_expenses(data_dir, monkeypatch):
+    monkeypatch.setattr(app, "CSV_TAIL_BLOCK", 2 << 10)
+    older = [("06/%02d/25" % (i % 28 + 1), "Food", 1.0, "", i) for i in range(1, 200)]
+    october = [("10/%02d/25" % (i % 28 + 1), "Food", 2.0, "", i) for i in range(200, 220)]
+    # More than a block of old rows after the October ones
+    statement = [("03/%02d/24" % (i % 28 + 1), "Bank", 3.0, "imported", i) for i in range(220, 400)]
+    write_ledger("expenses_u.csv", older + october + statement)
+    since = app.date_to_ordinal("10/01/25")
+    rows = app.read_csv_tail("expenses_u.csv", since)
+    assert [row[4] for row in rows if app.date_to_ordinal(row[0]) >= since] == list(range(200, 220))
+    assert rows[-1][4] == 399
+    assert len(rows) < 399   # still stops short of the older history